@@ -5,323 +5,143 @@
 
 import os
 import time
-import threading
-import urllib2
-import lxml.html as lh
-import itertools
 import argparse
-import re
-from math import factorial
-import ssl
+import shutil
+import tempfile
 
-from modules.sorting import quicksort_sections,get_sorted_daylists
-from modules.sorting import compress,prefer_free
-from modules.classes import Section,Course
-
-RATE_LIMIT = 1 # Max calls to get_course (and web requests) per second
-
-terms = {
-"fall15":"201590",
-"winter16":"201610",
-"summer16":"201650",
-"fall16":"201690",
-"winter17":"201710",
-"summer17":"201750",
-"fall17":"201690",
-"winter18":"201710",
-"summer18":"201750"
-}
-
-# Create bypass context
-ctx = ssl.create_default_context()
-ctx.check_hostname = False
-ctx.verify_mode = ssl.CERT_NONE
+from modules.sorting import get_sort_key,get_rank_key,top
+from modules.stream import external_sort
+from modules.cache import evict
+from modules.aurora import Aurora,AuroraError,terms,PARSERS,split_course_name
+from modules.api import generate,generate_ranked,best,count,Constraints
+from modules.search import Budget
+from modules.service import serve
+from modules.batch import run_batch
+from modules.render import Renderer,FORMATS,EXTENSIONS,COLLAPSE_LINE,get_header_lines
+from modules.instrument import Stats,timer,start_profile
+from modules import vectorized
 
 """
-    The function to print schedule data
-    to the outfile. Debug and error messages
-    instead use print().
+    Generates the valid combinations
+    for the command line arguments.
 """
-def print_write(text, verbose=False):
-    print >> outfile, text
-    
+def generate_from_args():
+    with timer(stats, "courses"):
+        return generate(args.term, args.must, args.would, args.number, constraints, aurora, budget, args.jobs, args.compact_first, stats, args.collapse)
+
 """
-    Print a combination of courses to the
-    outfile as a calendar.
+    Generates and sorts the valid combinations
+    for the command line arguments with NumPy.
 """
-def print_calendar(comb):
-    print_write("*********************  CALENDAR  **********************")
-    print_write("| MONDAY  || TUESDAY ||WEDNESDAY||THURSDAY || FRIDAY  |")
-    
-    # Create day lists (the columns of the calendar)
-    day_lists = get_sorted_daylists(comb)
-    
-    # Convert to iterators
-    day_iters = [iter(l) for l in day_lists]
-
-    still_printing = True
-    while still_printing:
-        l1 = "" #line 1
-        l2 = "" #line 2
-        l3 = "" #line 3
-        stops = 0 # number of times nothing was printed
-        print_write("|---------||---------||---------||---------||---------|")
-        for day_iter in day_iters:
-            try:
-                section = day_iter.next()
-                l1day = section.root_course.name.ljust(9)
-                l2day = section.name.center(9)
-                l3day = time.strftime("%I:%M %p",section.start_time).center(9)
-            except StopIteration:
-                stops+=1
-                l1day = "         "
-                l2day = "         "
-                l3day = "         "
-            l1 += "|" + l1day + "|"
-            l2 += "|" + l2day + "|"
-            l3 += "|" + l3day + "|"
-        if(stops == 5):
-            still_printing = False
-        if still_printing:
-            print_write(l1)
-            print_write(l2)
-            print_write(l3)
-
+def generate_ranked_from_args():
+    with timer(stats, "search"):
+        return generate_ranked(args.term, args.must, args.would, args.number, constraints, aurora,
+                not args.no_compression, args.prefer_free_days, args.rank, args.collapse)
 
 """
-    DECORATOR: Prevents function func
-    from being called more than max times
-    per second.
-    Used to rate limit get_course calls.
+    The key the schedules are sorted by,
+    or None to keep them in generated order.
 """
-def rate_limit(max):
-    lock = threading.Lock()
-    minInterval = 1.0 / float(max)
-    def decorate(func):
-        delta = [0.0]
-        def rate_limited_function(args,*kargs):
-            lock.acquire()
-            elapsed = time.clock() - delta[0]
-            remaining = minInterval - elapsed
-
-            if remaining>0:
-                time.sleep(remaining)
-
-            lock.release()
-
-            ret = func(args,*kargs)
-            delta[0] = time.clock()
-            return ret
-        return rate_limited_function
-    return decorate
+def get_key_from_args():
+    if args.rank:
+        return get_rank_key(args.rank)
+    return get_sort_key(not args.no_compression, args.prefer_free_days)
 
 """
-    Prints a combination of sections
-    to the outfile.
+    Starts the outfile. Text output begins
+    with lines describing the schedules.
 """
-def print_section_comb(comb):
-    print_write("**************  SCHEDULE  *******************")
-    for section in comb:
-        print_write(section.root_course.name + " : " + section.name + "    " + time.strftime("%I:%M %p",section.start_time) + " - " + time.strftime("%I:%M %p",section.end_time) + "    " + section.day)
+def print_header(count):
+    renderer.header(get_header_lines(count, not args.no_compression, args.prefer_free_days, args.rank,
+            args.top, args.collapse, budget.complete))
 
 """
-    Retrieves the course from Aurora.
+    --stream: write combinations to the outfile as
+    they are generated, without keeping them in memory.
+    Sorting is done with an external merge sort.
+    Otherwise the schedules are spooled to a temporary
+    file, because the header needs their count.
 """
-@rate_limit(RATE_LIMIT)
-def get_course(name, term, earliest, latest, offlinemode):
-    name = name.upper() # Note that name could be "MATH-1500" or "MATH-1500-A05-A06" etc.
-    name_parts = name.split(" ")
-    subj = name_parts[0]
-    crse = name_parts[1]
-    course = Course(subj + " " + crse)
-    
-    specific_sections = []
-    # Sections specified?
-    for sec_i in range(2, len(name_parts)):
-        specific_sections.append(name_parts[sec_i])
-    
-    # Retrieval
-    dpath = "cache/"+term+"/"
-    fpath = dpath + subj+"-"+crse+".html"
-    # Is it cached?
-    if os.path.exists(fpath):
-        html = lh.parse(fpath)
-        root = html.getroot()
-    elif not offlinemode:
-        url = "https://aurora.umanitoba.ca/banprod/bwckctlg.p_disp_listcrse?term_in="+term+"&subj_in="+subj+"&crse_in="+crse+"&schd_in=F02"
-        request = urllib2.Request(url)
-        #request.add_header('User-Agent', "Mozilla/5.0 (X11; U; Linux i686) AppleWebKit/536.16 (KHTML, like Gecko) Chrome/35.0.2049.59 Safari/536.16")
-        #request.add_header('Referer', "https://aurora.umanitoba.ca/banprod/bwckctlg.p_disp_course_detail?cat_term_in="+term+"&subj_code_in="+subj+"&crse_numb_in=" + crse)
-        response = urllib2.urlopen(request, timeout=30, context=ctx)
-        html = lh.parse(response)
-        
-        root = html.getroot()
-        if root is None:
-            print("Fatal error: failed to retrieve data for course "+name)
+def stream_output():
+    valid_combs = generate_from_args()
+    key = get_key_from_args()
+    
+    if key:
+        with timer(stats, "rank", exclude="search"):
+            count, valid_combs = external_sort(valid_combs, key)
+        if count == 0:
+            print("No courses could be generated. Perhaps your request was too specific?")
             exit()
-        
-        # Add to cache
-        data = lh.tostring(root)
-        if not os.path.exists(os.path.dirname(fpath)):
-            os.makedirs(os.path.dirname(fpath))
-        with open(fpath,'wb') as f:
-            f.write(data)
-    else:
-        print("Offline mode failed: Course " + name + " not found in /cache.")
-        exit()
-            
-    nodes = {}
-    """
-        "nodes" refers to the entries in the section table.
-        The table looks like this:
-        <tr><th><a>section title</a></th></tr>
-        <tr><td><a>section body</td></tr>
-        ...
-        We find all title elements (tr/th/a) and
-        associate their titles to the bodies (tr/td)
-        (which are two levels up and one sibling down)
-        using the nodes dict.
-        
-        The elements on Aurora don't use IDs, so it's safest
-        to use the long summaries.
-    """
-    # Downloaded HTML files may have tbody elements inserted by the browser.
-    if len(root.xpath(".//table[@summary='This layout table is used to present the sections found']/tr")) == 0:
-        tbody = "tbody/"
+        print("Writing to file...")
+        with timer(stats, "write"):
+            print_header(count)
+            for comb in valid_combs:
+                renderer.render(comb)
     else:
-        tbody = ""
-    
-    # NODE EXTRACTION
-    titlenodes = root.xpath(".//table[@summary='This layout table is used to present the sections found']/"+tbody+"tr/th[@class='ddtitle']/a")
-    
-    for title_a in titlenodes:
-        body_tr = title_a.getparent().getparent().getnext() # From tr/th/a to tr/ and the next tr is the body of the entry.
-        tablenode = body_tr.xpath("./td/table[@summary='This table lists the scheduled meeting times and assigned instructors for this class..']/"+tbody+"tr[2]")[0]
-        nodes[title_a.text] = tablenode
-    
-    for title,tablenode in nodes.items():
-        # Section
-        section_num = title[-3:]
-        
-        # Is a section specified?
-        if len(specific_sections) > 0 and section_num not in specific_sections:
-            continue
-        
-        # Only allow courses and labs
-        if not (section_num[0] == "A" or section_num[0] == "B"):
-            continue
-            
-        # Check for exclusion
-        if args.xclude and (course.name + " " + section_num) in args.xclude:
-            continue
-        
-        # Day
-        section_day = tablenode.find("./td[3]").text
-        if not section_day or ("TBD" in section_day) or ("TBA" in section_day):
-            continue
-        
-        # Time
-        section_time = tablenode.find("./td[2]").text
-        if not section_time:
-            continue
-        times = re.split(" *- *", section_time)
-        start_time = time.strptime(times[0], "%I:%M %p")
-        end_time = time.strptime(times[1], "%I:%M %p")
-        
-        # Earliest / latest checking
-        if (earliest and (start_time < earliest)) or (latest and (end_time > latest)):
-            continue
-        # It's a course
-        if section_num[0] == "A":
-            course.sections.append(Section(section_num, start_time, end_time, section_day, course))
-            
-        # It's a lab
-        elif section_num[0] == "B":
-            #create lab if not exists
-            if not course.haslab:
-                course.haslab = True
-                course.lab = Course(course.name)
-            course.lab.sections.append(Section(section_num, start_time, end_time, section_day, course))
-    return course
-
-
-    """
-    MAIN FUNCTION
-    """
-def get_valid_combs(number, term_string, m_course_strings, p_course_strings, earliest, latest, offlinemode):
-    valid_combs = []
-    m_courses = []   # A list of all mandatory courses. All are included in each iteration below.
-    p_courses = []   # A list of all potential courses. Used to fill up remaining spots, though all combinations are exausted.
-    
-    for coursename in m_course_strings:
-        course = get_course(coursename, term_string, earliest, latest, offlinemode)
-        m_courses.append(course)
-    for coursename in p_course_strings:
-        course = get_course(coursename, term_string, earliest, latest, offlinemode)
-        p_courses.append(course)
+        spool = tempfile.TemporaryFile()
+        spool_renderer = Renderer(spool, args.format)
+        with timer(stats, "write", exclude="search"):
+            for comb in valid_combs:
+                spool_renderer.render(comb)
+            spool_renderer.flush()
+        if spool_renderer.count == 0:
+            print("No courses could be generated. Perhaps your request was too specific?")
+            exit()
+        print("Writing to file...")
+        print_header(spool_renderer.count)
+        renderer.flush()
+        spool.seek(0)
+        shutil.copyfileobj(spool, outfile)
+        spool.close()
 
-    p_combs = itertools.combinations(p_courses, number-len(m_courses)) # set of tuples of possible ways to fill remaining spots
-    
-    # This is just looping nCr times, so the length of p_combs.
-    n = len(p_courses)
-    r = number-len(m_courses)
+"""
+    --top: score combinations as they are generated
+    and keep only the best args.top of them.
+"""
+def top_output():
+    valid_combs = generate_from_args()
+    key = get_key_from_args()
     
-    for i in range(factorial(n) // factorial(r) // factorial(n-r)):
-        courselist = list(next(p_combs)) + m_courses
-        assert(number == len(courselist)) #debugging
-        
-        combs = generate_valid_combinations(courselist)               # (local) list of possible combinations of courses.
+    count = [0]
+    def counted(combs):
         for comb in combs:
-            if len(comb) > 0:
-                valid_combs.append(comb)
-        
-    return valid_combs
-
-
-    """
-    Given a list of courses, generates a list of each
-    way to take each course (each section), and then
-    generates the Cartesian product of all of those
-    subsets. It iterates over the results and returns
-    those that are valid.
-    """
-def generate_valid_combinations(courselist):
-    
-    valid_combs = []                                               # list of valid combinations
-
-    s_lists = []                                                   # list of section lists of each course
-
-    for course in courselist:
-        s_lists.append(course.sections)
-        # Lab?
-        if (course.haslab):
-            s_lists.append(course.lab.sections)
-    
+            count[0] += 1
+            yield comb
+    with timer(stats, "rank", exclude="search"):
+        best_combs = top(counted(valid_combs), args.top, key)
+    if count[0] == 0:
+        print("No courses could be generated. Perhaps your request was too specific?")
+        exit()
     
-    section_combs = itertools.product(*s_lists)                     # set of tuples of ways to combine courses by section
-    count = 0
-    try:
-        while True:
-            section_comb = next(section_combs)
-            if is_valid_combination(section_comb):
-                valid_combs.append(section_comb)
-            count += 1
-            if args.cap and count >= args.cap:
-                break
-    except StopIteration:
-        pass
-    return valid_combs
+    print("Writing to file...")
+    with timer(stats, "write"):
+        print_header(count[0])
+        for comb in best_combs:
+            renderer.render(comb)
 
 """
-    Checks combinations for conflicts
+    --best: find the best args.best schedules by
+    branch and bound, without generating them all.
 """
-def is_valid_combination(sectionlist):
-
-    for section in sectionlist:                                    # loop through each section in the combination
-        for othersection in set(sectionlist) ^ set([section]):          # loop through all sections but this one
-            if section.conflicts_with(othersection):
-                return False
-    return True
+def best_output():
+    with timer(stats, "search"):
+        best_combs = best(args.term, args.must, args.would, args.number, args.best, args.prefer_free_days, constraints, aurora, args.collapse)
+    if len(best_combs) == 0:
+        print("No courses could be generated. Perhaps your request was too specific?")
+        exit()
+    
+    print("Writing to file...")
+    lines = ["- Found the best "+str(len(best_combs))+" schedules."]
+    if args.prefer_free_days:
+        lines.append("- Schedules with free days are listed first. (--prefer-free-days)")
+    lines.append("- These schedules are sorted by least time between classes to most. (--best)")
+    if args.collapse:
+        lines.append(COLLAPSE_LINE)
+    lines.append("\n\n")
+    with timer(stats, "write"):
+        renderer.header(lines)
+        for comb in best_combs:
+            renderer.render(comb)
 
 def runwizard():
     # args.term
@@ -391,22 +211,86 @@ if __name__ == "__main__":
     parser.add_argument('-x', '--xclude', nargs='+')
     
     parser.add_argument('-o', '--offline',  action='store_true')
+    parser.add_argument('--ttl', type=float)
+    parser.add_argument('--cache-max-age', type=float)
+    parser.add_argument('--cache-max-mb', type=float)
+    parser.add_argument('--parser', choices=PARSERS, default="tree")
     parser.add_argument('-v', '--verbose',  action='store_true')
 
     parser.add_argument('-e', '--earliest')
     parser.add_argument('-l', '--latest')
     
     parser.add_argument('-c', '--cap', type=int)
+    parser.add_argument('--time-limit', type=float)
+    parser.add_argument('--compact-first', action='store_true')
+    parser.add_argument('--collapse', action='store_true')
     
     # Optimization args
     parser.add_argument('--prefer-free-days', action='store_true')
     parser.add_argument('--no-compression', action='store_true')
+    parser.add_argument('--rank')
+    
+    parser.add_argument('-s', '--stream', action='store_true')
+    parser.add_argument('--top', type=int)
+    parser.add_argument('--best', type=int)
+    
+    parser.add_argument('-j', '--jobs', type=int)
+    parser.add_argument('--numpy', action='store_true')
+    
+    parser.add_argument('--format', choices=FORMATS, default="text")
+    
+    parser.add_argument('--count', action='store_true')
+    parser.add_argument('--serve', type=int)
+    parser.add_argument('--batch')
+    parser.add_argument('--prefetch', nargs='+')
+    
+    # Instrumentation args
+    parser.add_argument('--progress', action='store_true')
+    parser.add_argument('--stats', action='store_true')
+    parser.add_argument('--stats-file')
+    parser.add_argument('--profile')
     
     
     args = parser.parse_args()
     
+    if args.ttl is not None:
+        args.ttl = args.ttl * 3600
+    
+    # Service
+    if args.serve:
+        serve(args.serve, aurora=Aurora(args.offline, args.ttl, parser=args.parser), verbose=args.verbose)
+        exit()
+    
+    # Batch
+    if args.batch:
+        outdir = args.file or os.path.splitext(args.batch)[0] + "-out"
+        print("Running the requests in " + args.batch + "...")
+        try:
+            for request_id, fpath, request_count, error in run_batch(args.batch, outdir, Aurora(args.offline, args.ttl, parser=args.parser), args.jobs, args.format):
+                if error:
+                    print(request_id + ": " + error)
+                else:
+                    print(request_id + ": " + str(request_count) + " schedules, outputted to \"" + fpath + "\"")
+        except (IOError, ValueError) as e:
+            print(str(e))
+        exit()
+    
+    # Prefetch
+    if args.prefetch:
+        if not args.term or args.term.lower() not in terms:
+            print("You must specify a valid academic term. \nExample: '--term winter16'")
+            exit()
+        subjects = [i.upper() for i in args.prefetch]
+        print("Downloading the sections of " + ", ".join(subjects) + "...")
+        try:
+            for subject, courses in Aurora(args.offline, args.ttl).prefetch_subjects(subjects, terms[args.term.lower()]):
+                print(subject + ": " + str(courses) + " courses stored.")
+        except AuroraError as e:
+            print(str(e))
+        exit()
+    
     # Wizard
-    if not any(vars(args).values()):
+    if all(value == parser.get_default(name) for name, value in vars(args).items()): # Options like --format have defaults
         runwizard()
     
     if not args.must and not args.would:
@@ -432,7 +316,33 @@ if __name__ == "__main__":
     if (len(args.would) + len(args.must) < args.number or len(args.must) > args.number):
         print("The number of courses specified does not match the number desired.")
         exit()
+    
+    for name in args.must + args.would:
+        try:
+            split_course_name(name)
+        except ValueError as e:
+            print(str(e))
+            exit()
+        
+    if (args.top is not None and args.top < 1) or (args.best is not None and args.best < 1):
+        print("--top and --best need a number of schedules of at least 1.")
+        exit()
+    
+    if args.rank:
+        try:
+            get_rank_key(args.rank)
+        except ValueError as e:
+            print("Invalid --rank: " + str(e))
+            exit()
         
+    if args.numpy:
+        if not vectorized.available():
+            print("--numpy needs NumPy, which isn't installed. \nInstall it with 'pip install numpy'")
+            exit()
+        if args.cap or args.time_limit or (args.jobs and args.jobs > 1):
+            print("--numpy searches every schedule, so it can't be used with --cap, --time-limit or --jobs.")
+            exit()
+    
     # Exclusion parsing
     if args.xclude:
         args.xclude = [i.replace("-", " ") for i in args.xclude]
@@ -447,15 +357,45 @@ if __name__ == "__main__":
         exit()
     args.term = terms[args.term]
     
+    # Cache eviction
+    if args.cache_max_age is not None or args.cache_max_mb is not None:
+        max_age = args.cache_max_age * 86400 if args.cache_max_age is not None else None
+        max_bytes = args.cache_max_mb * 1024 * 1024 if args.cache_max_mb is not None else None
+        for term in evict("cache", args.term, max_age, max_bytes):
+            print("Removed term " + term + " from the cache.")
+    
     # Earliest / latest time parsing
     if args.earliest:
         args.earliest = time.strptime(args.earliest, "%I:%M %p")
     if args.latest:
         args.latest = time.strptime(args.latest, "%I:%M %p")
     
+    # Instrumentation
+    if args.profile:
+        start_profile(args.profile)
+    stats = None
+    if args.progress or args.stats or args.stats_file:
+        stats = Stats(args.progress)
+    
+    aurora = Aurora(args.offline, args.ttl, stats=stats, parser=args.parser)
+    constraints = Constraints(args.earliest, args.latest, args.xclude)
+    budget = Budget(args.cap, args.time_limit)
+    
+    # Count only
+    if args.count:
+        try:
+            counts = count(args.term, args.must, args.would, args.number, constraints, aurora, args.collapse)
+        except AuroraError as e:
+            print(str(e))
+            exit()
+        for names, subset_count in counts:
+            print(", ".join(names) + ": " + str(subset_count) + " schedules")
+        print("- " + str(sum(subset_count for names, subset_count in counts)) + " schedules can be generated.")
+        exit()
+    
     # File out
     if args.file:
-        args.file = args.file.replace(".txt","") + ".out.txt"
+        args.file = args.file.replace(".txt","") + ".out" + EXTENSIONS[args.format]
         if os.path.dirname(args.file) and not os.path.exists(os.path.dirname(args.file)):
             os.makedirs(os.path.dirname(args.file))
     else:
@@ -463,35 +403,53 @@ if __name__ == "__main__":
         args.file = " ".join(args.must + args.would)
         args.file = args.term + "-" + args.file
         args.file = args.file[:250] + (args.file[250:] and '..')
-        args.file = args.file.replace(" ","-") + ".out.txt"
-    outfile = file(args.file, 'w')
+        args.file = args.file.replace(" ","-") + ".out" + EXTENSIONS[args.format]
+    outfile = file(args.file, 'wb' if args.format == "binary" else 'w')
+    renderer = Renderer(outfile, args.format)
     
     # Main call
     print("Generating schedules...")
-    valid_combs = get_valid_combs(args.number, args.term, args.must, args.would, args.earliest, args.latest, args.offline)
-    if len(valid_combs) == 0:
-        print("No courses could be generated. Perhaps your request was too specific?")
+    try:
+        if args.best:
+            best_output()
+        elif args.top:
+            top_output()
+        elif args.stream:
+            stream_output()
+        else:
+            if args.numpy: # Sorted as they are generated
+                valid_combs = generate_ranked_from_args()
+            else:
+                valid_combs = list(generate_from_args())
+            if len(valid_combs) == 0:
+                print("No courses could be generated. Perhaps your request was too specific?")
+                exit()
+            
+            # Optimization
+            print("Optimizing...")
+            key = get_key_from_args()
+            if key and not args.numpy:
+                with timer(stats, "rank"):
+                    valid_combs.sort(key=key)
+            
+            # Schedule output
+            print("Writing to file...")
+            with timer(stats, "write"):
+                print_header(len(valid_combs))
+                for comb in valid_combs:
+                    renderer.render(comb)
+    except AuroraError as e:
+        print(str(e))
         exit()
-    
-    
-    # Pre-schedule output
-    print_write("- Generated "+str(len(valid_combs))+" schedules.")
-    
-    # Optimization
-    print("Optimizing...")
-    if not args.no_compression:
-        valid_combs = compress(valid_combs)
-        print_write("- These schedules are sorted by most compression to least compression.")
-    if args.prefer_free_days:
-        valid_combs = prefer_free(valid_combs)
-        print_write("- Schedules with free days are listed first. (--prefer-free-days)")
-    # Schedule output
-    print("Writing to file...")
-    print_write("\n\n")
-    for comb in valid_combs:
-        print_section_comb(comb)
-        print_write("\n")
-        print_calendar(comb)
-        print_write("\n\n\n\n\n")
+    with timer(stats, "write"):
+        renderer.flush()
+        outfile.close()
     print("Completed. Outputted to \"" + args.file + "\"")
+    
+    if stats:
+        stats.add("output.bytes", os.path.getsize(args.file))
+        if args.stats:
+            print(stats.summary())
+        if args.stats_file:
+            stats.dump(args.stats_file)
         
@@ -0,0 +1,767 @@
+# .:: AurOracle benchmarks ::.
+# Times the schedule search, conflict check, counting, ranking and best schedule search against the simple approaches they
+# replace, using the sections found in example-output.txt, and the
+# course page parsers on the pages in the cache, if any.
+#
+# With --synthetic, times each stage of a run (parse, search, rank,
+# render) on a generated catalog instead, and compares the times with
+# a baseline saved by an earlier run:
+#   python benchmark.py --synthetic --save-baseline baseline.json
+#   python benchmark.py --synthetic --baseline baseline.json
+#
+# With --linked, searches a generated catalog whose labs are linked to
+# lectures, with lecture and lab pairs as units, against searching
+# every pairing and dropping the ones that aren't linked.
+#
+# With --vectorized, searches and ranks generated catalogs of growing
+# size with the NumPy backend and in pure Python, to find the size from
+# which NumPy is faster.
+#
+# With --collapse, searches a generated catalog with sections that meet
+# at the same times interchangeable sections collapsed and not, and
+# checks that expanding the collapsed schedules gives the same ones.
+#
+# With --catalog, serves a generated catalog from a local web server,
+# prefetches it into a catalog store and checks and times looking its
+# courses up there against reading their cached pages. The server sends
+# ETags, and the cached pages are then revalidated with a ttl of 0, which
+# must only make conditional requests, get 304s and parse nothing.
+
+import os
+import sys
+import time
+import json
+import itertools
+import collections
+import random
+import re
+import argparse
+import glob
+import shutil
+import tempfile
+import threading
+import resource
+import BaseHTTPServer
+import SocketServer
+from urlparse import urlsplit,parse_qs
+import lxml.html as lh
+from StringIO import StringIO
+
+from modules.classes import Section,Course,DAY_BITS
+from modules.search import get_section_lists,iter_valid_combinations,best_combinations,idle_key
+from modules.search import count_valid_combinations
+from modules.conflicts import build_conflict_index,get_all_sections,is_valid_combination,comb_key,collapse_equivalent
+from modules.sorting import get_metrics,get_sort_key,Metrics
+from modules.synthetic import make_courses,make_course_page,make_listing_page,DAY_START_SLOTS
+from modules.aurora import Aurora,parse_course_page,parse_course_file,merge_meetings,CACHE_DIR
+from modules.api import iter_courselists
+from modules.render import Renderer
+from modules.instrument import product_size,Stats
+from modules import vectorized
+
+EXAMPLE_FILE = "example-output.txt"
+EXTRA_RATIO = 0.4 # Share of lectures with a second meeting in the checks of units
+EXTRA_SEEDS = 8   # Synthetic catalogs checked with them
+
+"""
+    Rebuild the courses of an output file from
+    the section lines of its schedules, e.g.
+    COMP 1010 : A04    12:30 PM - 01:20 PM    MWF
+"""
+def load_example_courses(fpath):
+    courses = {}    # course name : Course
+    seen = set()
+    order = []      # Course names in order of first appearance
+    line_re = re.compile(r"^([A-Z]{4} [0-9]{4}) : ([AB][0-9]{2}) +(.+?) - (.+?) +([MTWRF]+)$")
+    with open(fpath) as f:
+        for line in f:
+            match = line_re.match(line.strip())
+            if not match:
+                continue
+            name, section_num, start, end, day = match.groups()
+            if (name, section_num) in seen:
+                continue
+            seen.add((name, section_num))
+            if name not in courses:
+                courses[name] = Course(name)
+                order.append(name)
+            course = courses[name]
+            start_time = time.strptime(start, "%I:%M %p")
+            end_time = time.strptime(end, "%I:%M %p")
+            if section_num[0] == "A":
+                course.sections.append(Section(section_num, start_time, end_time, day, course))
+            else:
+                if not course.haslab:
+                    course.haslab = True
+                    course.lab = Course(course.name)
+                course.lab.sections.append(Section(section_num, start_time, end_time, day, course))
+    for course in courses.values():
+        course.sections.sort(key=lambda s: s.name)
+        if course.haslab:
+            course.lab.sections.sort(key=lambda s: s.name)
+    return [courses[name] for name in order]
+
+
+##############
+## BASELINE ##
+##############
+"""
+    The original search: test every tuple
+    of the Cartesian product.
+"""
+def product_combinations(s_lists):
+    return [comb for comb in itertools.product(*s_lists) if is_valid_combination_pairwise(comb)]
+
+"""
+    The original conflict check: compare
+    every pair of sections with conflicts_with.
+"""
+def is_valid_combination_pairwise(sectionlist):
+    for section in sectionlist:
+        for othersection in set(sectionlist) ^ set([section]):
+            if section.conflicts_with(othersection):
+                return False
+    return True
+
+
+"""
+    The original day lists: bucket by day letter,
+    then quicksort each day.
+"""
+def quicksort_daylists(comb):
+    day_lists = [[], [], [], [], []]
+    for section in comb:
+        for i, letter in enumerate("MTWRF"):
+            if section.days & DAY_BITS[letter]:
+                day_lists[i].append(section)
+    return [quicksort_sections(l) for l in day_lists]
+
+"""
+    Quicksorts a list of sections by
+    their start times.
+"""
+def quicksort_sections(olist):
+    nlist = list(olist)
+    return quickSortHelper(nlist,0,len(nlist)-1)
+    
+    
+
+def quickSortHelper(nlist,first,last):
+    if first<last:
+
+        splitpoint = partition(nlist,first,last)
+
+        quickSortHelper(nlist,first,splitpoint-1)
+        quickSortHelper(nlist,splitpoint+1,last)
+    
+    return nlist
+
+    
+def partition(nlist,first,last):
+    pivot = nlist[first]
+
+    leftmark = first+1
+    rightmark = last
+
+    done = False
+    while not done:
+
+        while leftmark <= rightmark and  nlist[leftmark].start <= pivot.start:
+            leftmark = leftmark + 1
+
+        while nlist[rightmark].start >= pivot.start and rightmark >= leftmark:
+            rightmark = rightmark -1
+
+        if rightmark < leftmark:
+            done = True
+        else:
+            temp = nlist[leftmark]
+            nlist[leftmark] = nlist[rightmark]
+            nlist[rightmark] = temp
+
+    temp = nlist[first]
+    nlist[first] = nlist[rightmark]
+    nlist[rightmark] = temp
+
+
+    return rightmark
+
+
+"""
+    Metrics from the sorted day lists, the way the
+    original compress and prefer_free looked at a
+    combination, with each day's gaps added up.
+"""
+def daylist_metrics(comb):
+    on = [day for day in quicksort_daylists(comb) if day]
+    gap = 0
+    gaps = 0
+    for day in on:
+        for x1, x2 in zip(day, day[1:]):
+            gap += x2.start - x1.end
+            gaps += 1
+    return Metrics(gap, gaps, 5 - len(on), min(day[0].start for day in on), max(day[-1].end for day in on), len(on))
+
+"""
+    The original ranking: sort by compression, then
+    sort again by free days, rebuilding the day lists
+    of every combination for each sort.
+"""
+def two_pass_sort(combs):
+    def compress_key(comb):
+        metrics = daylist_metrics(comb)
+        return (1,) if metrics.gaps == 0 else (0, metrics.gap / float(metrics.gaps), comb_key(comb))
+    return sorted(sorted(combs, key=compress_key), key=lambda comb: -daylist_metrics(comb).free)
+
+
+"""
+    Run func(*fargs) repeat times and
+    return (best time, result).
+"""
+def best_of(repeat, func, *fargs):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = func(*fargs)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+"""
+    Parse the course pages in the cache with lxml.html
+    and with the streaming parser.
+"""
+def bench_parse(fpaths, repeat):
+    def parse_tree(fpaths):
+        return [parse_course_page(lh.parse(fpath).getroot()) for fpath in fpaths]
+    def parse_stream(fpaths):
+        return [parse_course_file(fpath) for fpath in fpaths]
+
+    tree_time, tree = best_of(repeat, parse_tree, fpaths)
+    stream_time, stream = best_of(repeat, parse_stream, fpaths)
+    assert tree == stream, "parsers found different sections"
+    print("Parse " + str(len(fpaths)) + " cached pages (" + str(sum(len(i) for i in tree)) + " sections):")
+    print("  tree:      %.4fs" % tree_time)
+    print("  stream:    %.4fs  (%.1fx)" % (stream_time, tree_time / stream_time))
+
+def bench_search(courses, repeat):
+    s_lists = get_section_lists(courses)
+    total = 1
+    for l in s_lists:
+        total *= len(l)
+    print("Search: " + str(len(s_lists)) + " section lists, " + str(total) + " tuples in the product")
+
+    product_time, expected = best_of(repeat, product_combinations, s_lists)
+    backtrack_time, result = best_of(repeat, lambda l: list(iter_valid_combinations(l)), s_lists)
+
+    assert result == expected, "backtracking search returned different schedules"
+    print("  product:    %8.4fs  (%d schedules)" % (product_time, len(expected)))
+    print("  backtrack:  %8.4fs  (%d schedules)" % (backtrack_time, len(result)))
+    print("  speedup:    %8.1fx" % (product_time / max(backtrack_time, 1e-9)))
+
+
+"""
+    Micro-benchmark of the conflict check alone,
+    over every tuple of the Cartesian product.
+"""
+def bench_conflicts(courses, repeat):
+    s_lists = get_section_lists(courses)
+    tuples = list(itertools.product(*s_lists))
+    print("Conflict check: " + str(len(tuples)) + " tuples")
+
+    index_time, _ = best_of(repeat, build_conflict_index, get_all_sections(courses))
+    pairwise_time, expected = best_of(repeat, lambda t: [is_valid_combination_pairwise(c) for c in t], tuples)
+    mask_time, result = best_of(repeat, lambda t: [is_valid_combination(c) for c in t], tuples)
+
+    assert result == expected, "conflict index disagrees with conflicts_with"
+    print("  build index:%8.4fs" % index_time)
+    print("  pairwise:   %8.4fs" % pairwise_time)
+    print("  bitmask:    %8.4fs" % mask_time)
+    print("  speedup:    %8.1fx" % (pairwise_time / max(mask_time, 1e-9)))
+
+
+
+"""
+    Counting with memoization against
+    counting enumerated schedules.
+"""
+def bench_count(courses, repeat):
+    s_lists = get_section_lists(courses)
+    enumerate_time, expected = best_of(repeat, lambda l: sum(1 for comb in iter_valid_combinations(l)), s_lists)
+    count_time, result = best_of(repeat, count_valid_combinations, s_lists)
+
+    assert result == expected, "counting found a different number of schedules"
+    print("Count: " + str(result) + " schedules")
+    print("  enumerate:  %8.4fs" % enumerate_time)
+    print("  count:      %8.4fs" % count_time)
+    print("  speedup:    %8.1fx" % (enumerate_time / max(count_time, 1e-9)))
+
+
+"""
+    The single pass scorer against the day lists,
+    and one sort against sorting twice.
+"""
+def bench_rank(courses, repeat):
+    combs = list(iter_valid_combinations(get_section_lists(courses)))
+    for comb in combs:
+        assert get_metrics(comb) == daylist_metrics(comb), "metrics differ from the day lists"
+    print("Rank: " + str(len(combs)) + " schedules")
+
+    daylist_time, _ = best_of(repeat, lambda c: [daylist_metrics(comb) for comb in c], combs)
+    metrics_time, _ = best_of(repeat, lambda c: [get_metrics(comb) for comb in c], combs)
+    two_pass_time, expected = best_of(repeat, two_pass_sort, combs)
+    one_pass_time, result = best_of(repeat, lambda c: sorted(c, key=get_sort_key(True, True)), combs)
+
+    assert result == expected, "one sort ranked differently from two"
+    print("  day lists:  %8.4fs" % daylist_time)
+    print("  metrics:    %8.4fs" % metrics_time)
+    print("  two sorts:  %8.4fs" % two_pass_time)
+    print("  one sort:   %8.4fs" % one_pass_time)
+    print("  speedup:    %8.1fx" % (two_pass_time / max(one_pass_time, 1e-9)))
+
+
+"""
+    Branch and bound against enumerating and sorting
+    every schedule, choosing number of the courses.
+"""
+def bench_best(courses, repeat, number, n=10):
+    subsets = [get_section_lists(subset) for subset in itertools.combinations(courses, number)]
+    print("Best " + str(n) + ": " + str(len(subsets)) + " subsets of " + str(number) + " courses")
+
+    for free_days in (False, True):
+        enumerate_time, expected = best_of(repeat, enumerate_best, subsets, n, free_days)
+        bnb_time, result = best_of(repeat, best_combinations, subsets, n, free_days)
+
+        assert result == expected, "branch and bound found different schedules"
+        print("  free days: " + str(free_days))
+        print("    enumerate:%8.4fs" % enumerate_time)
+        print("    bound:    %8.4fs" % bnb_time)
+        print("    speedup:  %8.1fx" % (enumerate_time / max(bnb_time, 1e-9)))
+
+
+def enumerate_best(subsets, n, free_days):
+    combs = [comb for s_lists in subsets for comb in iter_valid_combinations(s_lists)]
+    return sorted(combs, key=lambda comb: idle_key(comb, free_days))[:n]
+
+"""
+    Check branch and bound against sorting every
+    schedule on synthetic catalogs whose lectures have
+    extra meetings, searched as units, for several
+    seeds. Each catalog is checked again with meetings
+    added that overlap their lectures, as Aurora lists
+    a slot again for other date ranges, after they go
+    through merge_meetings like courses from Aurora.
+"""
+def check_best_units(catalog, number, n=10):
+    overlapping = 0
+    for seed in range(EXTRA_SEEDS):
+        for overlap in (False, True):
+            courses = make_courses(**dict(catalog, seed=seed))
+            if overlap:
+                overlapping += add_overlapping_meetings(courses, random.Random(seed))
+            build_conflict_index(get_all_sections(courses))
+            subsets = [get_section_lists(subset) for subset in itertools.combinations(courses, number)]
+            for free_days in (False, True):
+                assert best_combinations(subsets, n, free_days) == enumerate_best(subsets, n, free_days), \
+                        "branch and bound found different schedules (seed %d, overlap %s)" % (seed, overlap)
+    print("Best %d with extra meetings (ratio %.1f): %d catalogs, %d overlapping meetings merged, OK"
+            % (n, catalog["extra_ratio"], 2 * EXTRA_SEEDS, overlapping))
+
+# Gives some lectures a meeting overlapping one of their days, merged
+# the way Aurora.get_course does. Returns how many were added.
+def add_overlapping_meetings(courses, rand):
+    added = 0
+    for course in courses:
+        meetings = [(section.name, section.start, section.end, section.day) for section in course.sections]
+        for section in course.sections:
+            if rand.random() < EXTRA_RATIO:
+                meetings.append((section.name, section.start + 20, section.end + 20, section.day[0]))
+                added += 1
+        course.sections = [Section(name, start, end, day, course) for name, start, end, day in merge_meetings(meetings)]
+    return added
+
+"""
+    Search a synthetic catalog with linked labs, once
+    with each lecture and its labs as units and once
+    with lectures and labs as independent lists, keeping
+    only the linked pairs. Both must find the same
+    schedules, in the same order.
+"""
+def bench_linked(catalog, number, repeat):
+    courses = make_courses(**dict(catalog, linked=True))
+    build_conflict_index(get_all_sections(courses))
+    subsets = [list(courselist) for courselist in iter_courselists(number, [], courses)]
+    links = dict((course.name, course.links) for course in courses)
+
+    def is_linked(comb):
+        lectures = {}
+        for section in comb:
+            if section.name[0] == "A":
+                lectures[section.root_course.name] = section.name
+        for section in comb:
+            course_links = links[section.root_course.name]
+            if section.name[0] == "B" and course_links is not None:
+                allowed = course_links.get(lectures[section.root_course.name])
+                if allowed is not None and section.name not in allowed:
+                    return False
+        return True
+
+    def search_units():
+        return [comb for courselist in subsets for comb in iter_valid_combinations(get_section_lists(courselist))]
+    def search_unlinked():
+        for course in courses:
+            course.links = None
+        try:
+            return [comb for courselist in subsets for comb in iter_valid_combinations(get_section_lists(courselist)) if is_linked(comb)]
+        finally:
+            for course in courses:
+                course.links = links[course.name]
+
+    units_product = sum(product_size(get_section_lists(courselist)) for courselist in subsets)
+    for course in courses:
+        course.links = None
+    unlinked_product = sum(product_size(get_section_lists(courselist)) for courselist in subsets)
+    for course in courses:
+        course.links = links[course.name]
+
+    unlinked_time, expected = best_of(repeat, search_unlinked)
+    units_time, result = best_of(repeat, search_units)
+    assert result == expected, "searching units found different schedules"
+    print("Linked labs: " + str(len(courses)) + " courses, subsets of " + str(number) + ", extra meetings "
+            + str(catalog["extra_ratio"]) + ", " + str(len(result)) + " schedules")
+    print("  unlinked:  %.4fs  product %d" % (unlinked_time, unlinked_product))
+    print("  units:     %.4fs  product %d  (%.1fx)" % (units_time, units_product, unlinked_time / max(units_time, 1e-9)))
+
+"""
+    Search and rank every schedule of a synthetic
+    catalog with more and more sections per course,
+    in pure Python (generate, then sort by key) and
+    with the NumPy backend, which must give the same
+    schedules in the same order. Shows the number of
+    schedules from which NumPy is faster.
+"""
+def bench_vectorized(catalog, number, repeat, sizes=(1, 2, 3, 4, 5, 6, 7)):
+    if not vectorized.available():
+        print("Vectorized: NumPy isn't installed.")
+        return
+    key = get_sort_key(True, False)
+    print("Vectorized: " + str(catalog["count"]) + " courses, subsets of " + str(number) + ", sorted by compression")
+    print("  %8s %10s %10s %10s" % ("sections", "schedules", "python", "numpy"))
+    crossover = None
+    for sections in sizes:
+        courses = make_courses(**dict(catalog, sections=sections, labs=None))
+        build_conflict_index(get_all_sections(courses))
+        s_lists_seq = [get_section_lists(courselist) for courselist in iter_courselists(number, [], courses)]
+        def python():
+            return sorted([comb for s_lists in s_lists_seq for comb in iter_valid_combinations(s_lists)], key=key)
+        python_time, expected = best_of(repeat, python)
+        numpy_time, result = best_of(repeat, vectorized.rank_combinations, s_lists_seq)
+        assert result == expected, "NumPy ranked differently"
+        print("  %8d %10d %9.4fs %9.4fs" % (sections, len(result), python_time, numpy_time))
+        if crossover is None and numpy_time < python_time:
+            crossover = len(result)
+    if crossover is None:
+        print("  NumPy was never faster.")
+    else:
+        print("  NumPy is faster from about " + str(crossover) + " schedules.")
+
+
+"""
+    Search every subset of a synthetic catalog once
+    as it is and once with interchangeable sections
+    collapsed (few --slots make more of them). Each
+    collapsed schedule, expanded to every choice of
+    its merged sections, must give exactly the
+    schedules found without collapsing.
+"""
+def bench_collapse(catalog, number, repeat):
+    courses = make_courses(**catalog)
+    collapsed = collapse_equivalent(courses)
+
+    def search(courselist):
+        build_conflict_index(get_all_sections(courselist))
+        return [comb for subset in iter_courselists(number, [], courselist) for comb in iter_valid_combinations(get_section_lists(subset))]
+    def names(comb):
+        return collections.OrderedDict(((section.root_course.name, section.name), None) for section in comb).keys()
+    def expand(comb):
+        choices = [[(course, name) for name in merged.split("/")] for course, merged in names(comb)]
+        return [frozenset(chosen) for chosen in itertools.product(*choices)]
+
+    full_time, expected = best_of(repeat, search, courses)
+    collapsed_time, result = best_of(repeat, search, collapsed)
+    expanded = collections.Counter(chosen for comb in result for chosen in expand(comb))
+    assert expanded == collections.Counter(frozenset(names(comb)) for comb in expected), "collapsing lost or added schedules"
+
+    def output_size(combs):
+        out = StringIO()
+        renderer = Renderer(out, "text")
+        for comb in combs:
+            renderer.render(comb)
+        renderer.flush()
+        return len(out.getvalue())
+    sections = len(get_all_sections(courses))
+    print("Collapse: " + str(len(courses)) + " courses, subsets of " + str(number) + ", "
+            + str(sections) + " sections, " + str(sections - len(get_all_sections(collapsed))) + " merged")
+    print("  full:       %.4fs  %8d schedules  %10d bytes" % (full_time, len(expected), output_size(expected)))
+    print("  collapsed:  %.4fs  %8d schedules  %10d bytes  (%.1fx)" % (collapsed_time, len(result), output_size(result),
+            full_time / max(collapsed_time, 1e-9)))
+
+
+############
+## STAGES ##
+############
+"""
+    Time each stage of a run on a synthetic catalog:
+    parsing its course pages, searching every subset
+    of number courses, ranking the schedules and
+    rendering them. Returns a report that can be saved
+    as a baseline and compared with later runs.
+"""
+def bench_stages(catalog, number, repeat):
+    courses = make_courses(**catalog)
+    pages = [make_course_page(course) for course in courses]
+    sections = get_all_sections(courses)
+    stages = {}
+
+    def stage(name, units, unit_name, func, *fargs):
+        elapsed, result = best_of(repeat, func, *fargs)
+        peak = stage_memory(func, *fargs)
+        stages[name] = elapsed
+        print("  %-8s%8.4fs  %10.0f %s/s  peak +%6.1f MB" % (name + ":", elapsed, units / max(elapsed, 1e-9), unit_name, peak))
+        return result
+
+    print("Stages: " + str(len(courses)) + " courses, " + str(len(sections)) + " sections, subsets of " + str(number))
+    parsed = stage("parse", len(pages), "pages", lambda p: [parse_course_page(lh.fromstring(page)) for page in p], pages)
+    for course, course_sections in zip(courses, parsed):
+        expected = [(s.name, s.start, s.end, s.day) for s in get_all_sections([course])]
+        assert sorted(course_sections) == sorted(expected), "parsed sections differ from " + course.name
+    streamed = stage("stream", len(pages), "pages", lambda p: [parse_course_file(StringIO(page)) for page in p], pages)
+    assert streamed == parsed, "streamed sections differ"
+
+    build_conflict_index(sections)
+    def search(courses):
+        return [comb for courselist in iter_courselists(number, [], courses)
+                for comb in iter_valid_combinations(get_section_lists(courselist))]
+    combs = search(courses)
+    stage("search", len(combs), "schedules", search, courses)
+    key = get_sort_key(True, False)
+    combs = stage("rank", len(combs), "schedules", lambda c: sorted(c, key=key), combs)
+    def render(combs):
+        with open(os.devnull, "w") as devnull:
+            renderer = Renderer(devnull)
+            for comb in combs:
+                renderer.render(comb)
+            renderer.flush()
+    stage("render", len(combs), "schedules", render, combs)
+
+    return {"catalog": catalog, "number": number, "schedules": len(combs), "stages": stages}
+
+"""
+    Runs func(*fargs) once in a forked process and
+    returns how much it raised that process's peak
+    memory (resident set) above what it started with,
+    in MB. ru_maxrss is the peak of the whole process
+    so far, so each stage needs a process of its own.
+"""
+def stage_memory(func, *fargs):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read)
+            start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            func(*fargs)
+            os.write(write, str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start))
+        finally:
+            os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        used = f.read()
+    os.waitpid(pid, 0)
+    return int(used or 0) / 1024.0 # ru_maxrss is in KB on Linux
+
+"""
+    Serve a synthetic catalog from a local web server
+    as one subject's listing and a page per course,
+    then look every course up in a fresh offline
+    Aurora, once from the cached pages and once from
+    the prefetched Catalog.
+"""
+def bench_catalog(catalog, repeat, term="201590"):
+    courses = make_courses(**catalog)
+    names = [course.name for course in courses]
+    listing = make_listing_page(courses)
+    pages = dict((course.name.split(" ")[1], make_course_page(course)) for course in courses)
+
+    revalidations = [] # Status of each conditional request
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            if "crse_in" not in query:
+                return self.send_body(listing)
+            etag = '"' + query["crse_in"][0] + '"' # Course pages never change here
+            if self.headers.get("If-None-Match") is not None:
+                revalidations.append(304 if self.headers.get("If-None-Match") == etag else 200)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_body(pages[query["crse_in"][0]], etag)
+        def send_body(self, body, etag=None):
+            self.send_response(200)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *fargs):
+            pass
+
+    class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True # Pooled connections are kept open
+
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base_url = "http://127.0.0.1:" + str(server.server_address[1])
+    cache_dir = tempfile.mkdtemp()
+    try:
+        Aurora(cache_dir=os.path.join(cache_dir, "pages"), base_url=base_url, rate=1000).prefetch_courses(names, term)
+        start = time.time()
+        list(Aurora(cache_dir=os.path.join(cache_dir, "catalog"), base_url=base_url, rate=1000).prefetch_subjects(["SYNT"], term))
+        prefetch_time = time.time() - start
+
+        def lookup(cache):
+            aurora = Aurora(offline=True, cache_dir=os.path.join(cache_dir, cache))
+            return [aurora.get_course_sections(name, term) for name in names]
+        pages_time, from_pages = best_of(repeat, lookup, "pages")
+        catalog_time, from_catalog = best_of(repeat, lookup, "catalog")
+        for course, page_sections, catalog_sections in zip(courses, from_pages, from_catalog):
+            expected = [(s.name, s.start, s.end, s.day) for s in get_all_sections([course])]
+            assert sorted(page_sections) == sorted(catalog_sections) == sorted(expected), "catalog differs for " + course.name
+        check_revalidation(os.path.join(cache_dir, "pages"), base_url, names, term, from_pages, revalidations)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir)
+
+    print("Catalog: " + str(len(courses)) + " courses, " + str(len(get_all_sections(courses))) + " sections")
+    print("  prefetch:  %.4fs" % prefetch_time)
+    print("  pages:     %.4fs" % pages_time)
+    print("  catalog:   %.4fs  (%.1fx)" % (catalog_time, pages_time / catalog_time))
+    print("  revalidate: %d conditional requests, all 304, nothing parsed or rewritten" % len(revalidations))
+
+"""
+    With a ttl of 0, every cached page is revalidated:
+    once by prefetch_courses and once more course by
+    course. Every request must be conditional and get
+    a 304, and the pages and their parsed sections must
+    be reused without being parsed or written again.
+"""
+def check_revalidation(cache_dir, base_url, names, term, expected, revalidations):
+    files = glob.glob(os.path.join(cache_dir, term, "*.html")) + glob.glob(os.path.join(cache_dir, term, "*.json"))
+    mtimes = dict((fpath, os.path.getmtime(fpath)) for fpath in files)
+    time.sleep(0.01) # So a rewrite would change the mtimes
+    stats = Stats()
+    aurora = Aurora(ttl=0, cache_dir=cache_dir, base_url=base_url, rate=1000, stats=stats)
+    aurora.prefetch_courses(names, term)
+    assert [aurora.get_course_sections(name, term) for name in names] == expected, "revalidated sections differ"
+    aurora = Aurora(ttl=0, cache_dir=cache_dir, base_url=base_url, rate=1000, stats=stats)
+    assert [aurora.get_course_sections(name, term) for name in names] == expected, "revalidated sections differ"
+
+    assert stats.counters.get("aurora.requests") == 2 * len(names) == len(revalidations), "not every request was conditional"
+    assert set(revalidations) == set([304]), "a conditional request didn't get a 304"
+    assert stats.counters.get("aurora.pages_parsed", 0) == 0, "a page was parsed again after a 304"
+    assert all(os.path.getmtime(fpath) == mtime for fpath, mtime in mtimes.items()), "a cached file was rewritten after a 304"
+
+"""
+    Compare a report with a saved baseline. Returns
+    False if the schedules differ or a stage is more
+    than tolerance times slower.
+"""
+def compare_baseline(report, baseline, tolerance):
+    if (baseline["catalog"], baseline["number"]) != (report["catalog"], report["number"]):
+        print("Baseline is for a different catalog, not comparing.")
+        return True
+    ok = True
+    if baseline["schedules"] != report["schedules"]:
+        print("  REGRESSION: " + str(report["schedules"]) + " schedules, baseline had " + str(baseline["schedules"]))
+        ok = False
+    print("Against baseline:")
+    for name, elapsed in sorted(report["stages"].items()):
+        ratio = elapsed / max(baseline["stages"].get(name, elapsed), 1e-9)
+        slower = ratio > tolerance
+        print("  %-8s%8.2fx%s" % (name + ":", ratio, "  SLOWER" if slower else ""))
+        ok = ok and not slower
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', default=EXAMPLE_FILE)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+
+    # Synthetic catalog
+    parser.add_argument('--synthetic', action='store_true')
+    parser.add_argument('--catalog', action='store_true')
+    parser.add_argument('--linked', action='store_true')
+    parser.add_argument('--vectorized', action='store_true')
+    parser.add_argument('--collapse', action='store_true')
+    parser.add_argument('--extra-ratio', type=float, default=0.0)
+    parser.add_argument('--courses', type=int, default=7)
+    parser.add_argument('--sections', type=int, default=5)
+    parser.add_argument('--labs', type=int)
+    parser.add_argument('--lab-ratio', type=float, default=0.5)
+    parser.add_argument('--slots', type=int, default=DAY_START_SLOTS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-n', '--number', type=int, default=4)
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    catalog = {"count": args.courses, "sections": args.sections, "labs": args.labs,
+               "lab_ratio": args.lab_ratio, "slots": args.slots, "seed": args.seed, "extra_ratio": args.extra_ratio}
+    if args.linked:
+        for extra_ratio in sorted(set([args.extra_ratio, EXTRA_RATIO])):
+            bench_linked(dict(catalog, extra_ratio=extra_ratio), args.number, args.repeat)
+        sys.exit(0)
+    if args.vectorized:
+        bench_vectorized(catalog, args.number, args.repeat)
+        sys.exit(0)
+    if args.collapse:
+        bench_collapse(catalog, args.number, args.repeat)
+        sys.exit(0)
+    if args.catalog:
+        bench_catalog(catalog, args.repeat)
+        sys.exit(0)
+    if args.synthetic:
+        report = bench_stages(catalog, args.number, args.repeat)
+        if args.save_baseline:
+            with open(args.save_baseline, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            print("Saved baseline to " + args.save_baseline)
+        if args.baseline:
+            with open(args.baseline) as f:
+                if not compare_baseline(report, json.load(f), args.tolerance):
+                    sys.exit(1)
+        sys.exit(0)
+
+    courses = load_example_courses(args.file)
+    print("Loaded " + ", ".join(c.name for c in courses) + " from " + args.file)
+    build_conflict_index(get_all_sections(courses))
+    bench_search(courses, args.repeat)
+    bench_conflicts(courses, args.repeat)
+    bench_count(courses, args.repeat)
+    bench_rank(courses, args.repeat)
+    bench_best(courses, args.repeat, len(courses))
+    bench_best(courses, args.repeat, len(courses) - 2)
+    check_best_units(dict(catalog, extra_ratio=args.extra_ratio or EXTRA_RATIO), args.number)
+    fpaths = sorted(glob.glob(os.path.join(args.cache_dir, "*", "*.html")))
+    if fpaths:
+        bench_parse(fpaths, args.repeat)
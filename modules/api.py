@@ -0,0 +1,238 @@
+import time
+import itertools
+from math import factorial
+
+from modules.aurora import Aurora,terms,split_course_name
+from modules.classes import to_minutes
+from modules.search import get_section_lists,iter_valid_combinations,best_combinations,count_valid_combinations
+from modules.search import fair_combinations,compact_first
+from modules.conflicts import build_conflict_index,get_all_sections,collapse_equivalent
+from modules.parallel import parallel_combinations
+from modules.instrument import instrumented_combinations,counted_combinations
+from modules.vectorized import rank_combinations
+
+"""
+    Which sections a student can take.
+
+    earliest and latest can be minutes since midnight,
+    time.struct_time or strings like "9:30 AM".
+    xclude is a list of sections like "COMP 1010 A01"
+    (or "COMP-1010-A01").
+"""
+class Constraints:
+
+    def __init__(self, earliest=None, latest=None, xclude=None):
+        self.earliest = parse_time(earliest)
+        self.latest = parse_time(latest)
+        self.xclude = set(normalize_course_name(i) for i in (xclude or []))
+
+    def key(self):
+        return (self.earliest, self.latest, frozenset(self.xclude))
+
+    """
+        Is every section these constraints allow
+        also allowed by other? If so, results for other
+        can be filtered instead of generated again.
+    """
+    def within(self, other):
+        if other.earliest is not None and (self.earliest is None or self.earliest < other.earliest):
+            return False
+        if other.latest is not None and (self.latest is None or self.latest > other.latest):
+            return False
+        return other.xclude <= self.xclude
+
+    def allows_section(self, section):
+        return self.allows(section.root_course.name, section.name, section.start, section.end)
+
+    def allows(self, course_name, section_num, start, end):
+        # Check for exclusion
+        if (course_name + " " + section_num) in self.xclude:
+            return False
+        # Earliest / latest checking
+        if (self.earliest is not None and start < self.earliest) or (self.latest is not None and end > self.latest):
+            return False
+        return True
+
+def parse_time(t):
+    if t is None or t == "":
+        return None
+    if isinstance(t, basestring):
+        t = time.strptime(t, "%I:%M %p")
+    return to_minutes(t)
+
+def normalize_course_name(name):
+    return name.replace("-", " ").upper()
+
+"""
+    Converts a term name like "fall15" to its
+    Aurora code. Codes are passed through.
+"""
+def get_term_code(term):
+    term = term.lower()
+    if term in terms:
+        return terms[term]
+    if term in terms.values():
+        return term
+    raise ValueError("Invalid academic term: " + term)
+
+
+"""
+    Retrieves the mandatory and potential courses
+    and indexes the conflicts between their sections.
+    With collapse, interchangeable sections are merged
+    first (see modules.conflicts.collapse_equivalent).
+"""
+def get_courses(aurora, term_code, m_course_strings, p_course_strings, constraints=None, collapse=False):
+    m_courses = []   # A list of all mandatory courses. All are included in each iteration below.
+    p_courses = []   # A list of all potential courses. Used to fill up remaining spots, though all combinations are exausted.
+
+    aurora.prefetch_courses(m_course_strings + p_course_strings, term_code)
+    for coursename in m_course_strings:
+        m_courses.append(aurora.get_course(coursename, term_code, constraints))
+    for coursename in p_course_strings:
+        p_courses.append(aurora.get_course(coursename, term_code, constraints))
+    if collapse:
+        m_courses = collapse_equivalent(m_courses)
+        p_courses = collapse_equivalent(p_courses)
+
+    # Index conflicts between every section once, for all subsets below
+    build_conflict_index(get_all_sections(m_courses + p_courses))
+    return m_courses, p_courses
+
+"""
+    Yields each list of courses to search: the
+    mandatory courses plus one way of choosing
+    potential courses to fill the remaining spots.
+"""
+def iter_courselists(number, m_courses, p_courses):
+    p_combs = itertools.combinations(p_courses, number-len(m_courses)) # set of tuples of possible ways to fill remaining spots
+
+    # This is just looping nCr times, so the length of p_combs.
+    n = len(p_courses)
+    r = number-len(m_courses)
+
+    for i in range(factorial(n) // factorial(r) // factorial(n-r)):
+        courselist = list(next(p_combs)) + m_courses
+        assert(number == len(courselist)) #debugging
+        yield courselist
+
+"""
+    Given a list of courses, generates each way
+    to take each course (each section) by searching
+    the section lists depth-first, pruning a partial
+    schedule as soon as it conflicts, and yields
+    the valid combinations.
+"""
+def generate_valid_combinations(courselist):
+
+    s_lists = get_section_lists(courselist)                        # list of section lists of each course
+
+    for section_comb in iter_valid_combinations(s_lists):
+        yield section_comb
+
+
+"""
+    Checks and normalizes the arguments shared by
+    generate and best, and returns them as
+    (aurora, term code, must, would, number).
+"""
+def prepare_request(term, must, would, number, aurora):
+    must = [normalize_course_name(i) for i in must]
+    would = [normalize_course_name(i) for i in (would or [])]
+    for name in must + would:
+        split_course_name(name) # Raises ValueError for a malformed name
+    if number is None:
+        number = len(must)
+    if len(would) + len(must) < number or len(must) > number:
+        raise ValueError("The number of courses specified does not match the number desired.")
+    return aurora or Aurora(), get_term_code(term), must, would, number
+
+"""
+    Generates every valid schedule for a student who must
+    take the courses in must and fills the remaining spots
+    up to number with courses from would.
+
+    The courses are retrieved right away, and an iterator
+    over tuples of modules.classes.Section is returned.
+    Course names
+    can be "MATH 1500", "MATH-1500" or "MATH-1500-A01-A02".
+    Pass an Aurora to reuse its connections and parsed
+    courses across calls.
+
+    budget is a modules.search.Budget limiting the whole
+    run, which is then spread fairly across the subsets
+    of would; check budget.complete afterwards. With
+    compact, the budget is spent on compact schedules
+    first. Otherwise jobs > 1 searches the subsets in
+    that many processes.
+
+    stats is a modules.instrument.Stats to record the
+    search in, or None.
+
+    With collapse, sections meeting at the same times
+    are merged into one named after all of them, such
+    as "B01/B02", and each schedule is generated once
+    for all of them.
+"""
+def generate(term, must, would=None, number=None, constraints=None, aurora=None, budget=None, jobs=None, compact=False, stats=None, collapse=False):
+    aurora, term_code, must, would, number = prepare_request(term, must, would, number, aurora)
+    m_courses, p_courses = get_courses(aurora, term_code, must, would, constraints, collapse)
+    courselists = iter_courselists(number, m_courses, p_courses)
+
+    if budget and budget.limited():
+        s_lists_seq = [get_section_lists(courselist) for courselist in courselists]
+        if compact:
+            s_lists_seq = [compact_first(s_lists) for s_lists in s_lists_seq]
+        combs = fair_combinations(s_lists_seq, budget)
+    elif jobs and jobs > 1:
+        s_lists_seq = [get_section_lists(courselist) for courselist in courselists]
+        combs = parallel_combinations(s_lists_seq, jobs)
+    elif stats:
+        combs = instrumented_combinations((get_section_lists(courselist) for courselist in courselists), stats)
+    else:
+        combs = (comb for courselist in courselists for comb in generate_valid_combinations(courselist))
+    if stats:
+        if budget and budget.limited() or jobs and jobs > 1:
+            combs = counted_combinations(combs, stats)
+        combs = stats.timed("search", combs)
+    return (comb for comb in combs if len(comb) > 0)
+
+"""
+    Like generate, but only the n schedules with the least
+    time between classes (most free days first, with
+    free_days), found by branch and bound.
+"""
+def best(term, must, would=None, number=None, n=10, free_days=False, constraints=None, aurora=None, collapse=False):
+    aurora, term_code, must, would, number = prepare_request(term, must, would, number, aurora)
+    m_courses, p_courses = get_courses(aurora, term_code, must, would, constraints, collapse)
+    s_lists_seq = (get_section_lists(courselist) for courselist in iter_courselists(number, m_courses, p_courses))
+    return best_combinations(s_lists_seq, n, free_days)
+
+"""
+    Like generate followed by sorting the schedules by
+    modules.sorting.get_sort_key(compression, free_days),
+    or get_rank_key(rank) if rank is given, but searched
+    and ranked in blocks with NumPy, which must be
+    installed (see modules.vectorized). Returns the
+    sorted list of schedules.
+"""
+def generate_ranked(term, must, would=None, number=None, constraints=None, aurora=None, compression=True, free_days=False, rank=None, collapse=False):
+    aurora, term_code, must, would, number = prepare_request(term, must, would, number, aurora)
+    m_courses, p_courses = get_courses(aurora, term_code, must, would, constraints, collapse)
+    s_lists_seq = (get_section_lists(courselist) for courselist in iter_courselists(number, m_courses, p_courses))
+    return rank_combinations(s_lists_seq, compression, free_days, rank)
+
+"""
+    Counts the schedules generate would produce (without
+    a budget), without generating them. Returns a list of
+    (names of the courses in the subset, count) for each
+    subset of would.
+"""
+def count(term, must, would=None, number=None, constraints=None, aurora=None, collapse=False):
+    aurora, term_code, must, would, number = prepare_request(term, must, would, number, aurora)
+    m_courses, p_courses = get_courses(aurora, term_code, must, would, constraints, collapse)
+    counts = []
+    for courselist in iter_courselists(number, m_courses, p_courses):
+        s_lists = get_section_lists(courselist)
+        counts.append(([course.name for course in courselist], count_valid_combinations(s_lists) if s_lists else 0))
+    return counts
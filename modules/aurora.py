@@ -0,0 +1,628 @@
+import os
+import time
+import re
+import ssl
+from StringIO import StringIO
+import lxml.html as lh
+from lxml import etree
+
+from modules.classes import Section,Course,to_minutes,DAYS
+from modules.fetch import TokenBucket,ConnectionPool,fetch_all
+from modules.cache import load_parsed,save_parsed
+from modules.cache import save_meta,is_fresh,get_conditional_headers
+from modules.catalog import Catalog,get_catalog_path
+
+RATE_LIMIT = 1 # Max web requests per second
+FETCH_WORKERS = 4 # Max web requests at once
+CACHE_DIR = "cache"
+PARSERS = ("tree", "stream")
+AURORA_URL = "https://aurora.umanitoba.ca"
+AURORA_HEADERS = {
+#"User-Agent": "Mozilla/5.0 (X11; U; Linux i686) AppleWebKit/536.16 (KHTML, like Gecko) Chrome/35.0.2049.59 Safari/536.16",
+}
+
+terms = {
+"fall15":"201590",
+"winter16":"201610",
+"summer16":"201650",
+"fall16":"201690",
+"winter17":"201710",
+"summer17":"201750",
+"fall17":"201690",
+"winter18":"201710",
+"summer18":"201750"
+}
+
+"""
+    Raised when a course can't be retrieved.
+"""
+class AuroraError(Exception):
+    pass
+
+"""
+    Splits a course name such as "MATH 1500" or
+    "MATH 1500 A05 A06" into the subject, the
+    course number and a list of specific sections.
+    Raises ValueError if name has no course number.
+"""
+def split_course_name(name):
+    name_parts = name.upper().split(" ")
+    if len(name_parts) < 2 or not all(name_parts):
+        raise ValueError("Invalid course name: " + name + " (example: MATH-1500)")
+    return name_parts[0], name_parts[1], name_parts[2:]
+
+def get_course_url_path(term, subj, crse):
+    return "/banprod/bwckctlg.p_disp_listcrse?term_in="+term+"&subj_in="+subj+"&crse_in="+crse+"&schd_in=F02"
+
+# The class schedule search, for every section of one subject
+def get_subject_url_path(term, subj):
+    return ("/banprod/bwckschd.p_get_crse_unsec?term_in="+term
+            +"&sel_subj=dummy&sel_day=dummy&sel_schd=dummy&sel_insm=dummy&sel_camp=dummy&sel_levl=dummy"
+            +"&sel_sess=dummy&sel_instr=dummy&sel_ptrm=dummy&sel_attr=dummy"
+            +"&sel_subj="+subj+"&sel_crse=&sel_title=&sel_schd=%25&sel_from_cred=&sel_to_cred="
+            +"&sel_camp=%25&sel_levl=%25&sel_ptrm=%25&sel_instr=%25&sel_attr=%25"
+            +"&begin_hh=0&begin_mi=0&begin_ap=a&end_hh=0&end_mi=0&end_ap=a")
+
+
+"""
+    Retrieves courses from Aurora, through the cache.
+
+    Holds everything a run shares: the connection pool
+    and rate limit for web requests, and the parsed
+    sections of every course seen so far, which stay in
+    memory so a long-running process parses each course
+    page once.
+
+    ttl is the age in seconds after which a cached page
+    is revalidated with Aurora, or None to trust the
+    cache forever. offline never goes to Aurora.
+
+    stats is a modules.instrument.Stats to record the
+    time spent on the network, reading the cache and
+    parsing, and how each course was found, or None.
+
+    parser is "tree" to parse cached pages into a tree
+    with lxml.html, or "stream" to read their sections
+    in one pass with parse_course_file.
+
+    Courses of subjects stored with prefetch_subjects
+    are looked up in the term's Catalog before the
+    cached course pages.
+"""
+class Aurora:
+
+    def __init__(self, offline=False, ttl=None, cache_dir=CACHE_DIR, base_url=AURORA_URL, rate=RATE_LIMIT, workers=FETCH_WORKERS, stats=None, parser="tree"):
+        if parser not in PARSERS:
+            raise ValueError("Unknown parser: " + parser)
+        self.offline = offline
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.stats = stats
+        self.parser = parser
+
+        # Create bypass context
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+
+        # Shared by every web request
+        self.bucket = TokenBucket(rate)
+        self.pool = ConnectionPool(base_url, workers, 30, ctx)
+        self.checked_pages = set() # Cache paths of pages fetched or revalidated by this instance
+        self.parsed = {}           # Cache path : parsed sections
+        self.catalogs = {}         # Term : Catalog, or None if the term has none
+
+    def get_cache_path(self, term, subj, crse):
+        return os.path.join(self.cache_dir, term, subj+"-"+crse+".html")
+
+    def record(self, timer, start, counter=None):
+        if self.stats:
+            self.stats.add_time(timer, time.time() - start)
+            if counter:
+                self.stats.add(counter)
+
+    """
+        Parses a downloaded course page and adds it to
+        the cache. A 304 Not Modified response renews
+        the cached page instead and returns None, as the
+        sections parsed from it are still good.
+    """
+    def store_course_page(self, name, fpath, status, headers, body):
+        self.checked_pages.add(fpath)
+        if status == 304 and os.path.exists(fpath):
+            save_meta(fpath)
+            return None
+
+        root = None
+        if status == 200 and body:
+            root = lh.parse(StringIO(body)).getroot()
+        if root is None:
+            raise AuroraError("Fatal error: failed to retrieve data for course "+name)
+
+        # Add to cache
+        data = lh.tostring(root)
+        if not os.path.exists(os.path.dirname(fpath)):
+            os.makedirs(os.path.dirname(fpath))
+        with open(fpath,'wb') as f:
+            f.write(data)
+        save_meta(fpath, headers)
+        return root
+
+    """
+        Headers for requesting a course page, made
+        conditional if a cached copy exists.
+    """
+    def get_request_headers(self, fpath):
+        headers = dict(AURORA_HEADERS)
+        if os.path.exists(fpath):
+            headers.update(get_conditional_headers(fpath))
+        return headers
+
+    """
+        Forgets that this instance fetched or revalidated
+        a course's page, so it is revalidated again once
+        it is older than the ttl.
+    """
+    def expire(self, name, term):
+        subj, crse, _ = split_course_name(name)
+        self.checked_pages.discard(self.get_cache_path(term, subj, crse))
+
+    """
+        Can the cached copy of a course page be used
+        without asking Aurora whether it changed?
+    """
+    def is_cache_usable(self, fpath):
+        return os.path.exists(fpath) and (self.offline or fpath in self.checked_pages or is_fresh(fpath, self.ttl))
+
+    """
+        Gets the root element of a course page, from the
+        cache or else from Aurora. Cached pages older than
+        the ttl are revalidated with a conditional request.
+    """
+    def get_course_page(self, name, term):
+        subj, crse, _ = split_course_name(name)
+        fpath = self.get_cache_path(term, subj, crse)
+        # Is it cached?
+        if not self.is_cache_usable(fpath):
+            if self.offline:
+                raise AuroraError("Offline mode failed: Course " + name + " not found in /cache.")
+            root = self.fetch_course_page(name, term)
+            if root is not None:
+                return root
+        start = time.time()
+        html = lh.parse(fpath)
+        self.record("aurora.read_page", start, "aurora.pages_read")
+        return html.getroot()
+
+    """
+        Downloads a course page, or revalidates the
+        cached one, and returns its root, or None if
+        Aurora says the cached page is unchanged.
+    """
+    def fetch_course_page(self, name, term):
+        subj, crse, _ = split_course_name(name)
+        fpath = self.get_cache_path(term, subj, crse)
+        start = time.time()
+        self.bucket.acquire()
+        self.record("aurora.rate_limit", start)
+        start = time.time()
+        status, headers, body = self.pool.get(get_course_url_path(term, subj, crse), self.get_request_headers(fpath))
+        self.record("aurora.network", start, "aurora.requests")
+        return self.store_course_page(name, fpath, status, headers, body)
+
+    """
+        Downloads every course that isn't cached yet or
+        is older than the ttl, workers at a time within
+        the rate limit, and parses each page as it arrives.
+    """
+    def prefetch_courses(self, names, term):
+        if self.offline:
+            return
+        paths = {} # url path : (course name, cache path)
+        for name in names:
+            subj, crse, _ = split_course_name(name)
+            fpath = self.get_cache_path(term, subj, crse)
+            if not self.is_cache_usable(fpath) and self.get_catalog_sections(term, subj, crse) is None:
+                paths[get_course_url_path(term, subj, crse)] = (name, fpath)
+        requests = [(path, self.get_request_headers(fpath)) for path, (name, fpath) in paths.items()]
+        downloads = fetch_all(self.pool, requests, self.bucket, self.workers)
+        if self.stats: # Time spent waiting for downloads, including the rate limit
+            downloads = self.stats.timed("aurora.network", downloads)
+        for path, (status, headers, body) in downloads:
+            if self.stats:
+                self.stats.add("aurora.requests")
+            name, fpath = paths[path]
+            root = self.store_course_page(name, fpath, status, headers, body)
+            if root is not None: # Unchanged pages keep their parsed sections
+                self.parse_sections(fpath, root)
+
+    """
+        Gets every lecture and lab section of a course
+        as (section number, start, end, day) tuples, with
+        times in minutes since midnight. The parsed sections
+        are cached, so the course page is only parsed again
+        when it changes (a 304 from Aurora keeps them).
+        Filtering is left to get_course, so one cached
+        entry serves every query. Courses that aren't in
+        memory are looked up in the term's Catalog before
+        the cached pages.
+    """
+    def get_course_sections(self, name, term):
+        subj, crse, _ = split_course_name(name)
+        fpath = self.get_cache_path(term, subj, crse)
+        usable = self.is_cache_usable(fpath)
+        if usable and fpath in self.parsed:
+            if self.stats:
+                self.stats.add("aurora.memory_hits")
+            return self.parsed[fpath]
+        sections = self.get_catalog_sections(term, subj, crse)
+        if sections is not None:
+            return sections
+        if not usable and not self.offline:
+            root = self.fetch_course_page(name, term)
+            if root is not None:
+                return self.parse_sections(fpath, root)
+            usable = True # Unchanged
+            if fpath in self.parsed:
+                return self.parsed[fpath]
+        if usable:
+            start = time.time()
+            sections = load_parsed(fpath)
+            if sections is not None:
+                self.record("aurora.read_parsed", start, "aurora.parsed_hits")
+                self.parsed[fpath] = sections
+                return sections
+            if self.parser == "stream":
+                return self.parse_sections(fpath)
+        return self.parse_sections(fpath, self.get_course_page(name, term))
+
+    """
+        Parses the sections of a course page from its
+        root, or else streams them from the cached page.
+    """
+    def parse_sections(self, fpath, root=None):
+        start = time.time()
+        if root is None:
+            sections = parse_course_file(fpath)
+        else:
+            sections = parse_course_page(root)
+        self.record("aurora.parse", start, "aurora.pages_parsed")
+        save_parsed(fpath, sections)
+        self.parsed[fpath] = sections
+        return sections
+
+    """
+        The term's Catalog, or None if nothing was
+        prefetched for it (unless create).
+    """
+    def get_catalog(self, term, create=False):
+        catalog = self.catalogs.get(term)
+        if catalog is None:
+            fpath = get_catalog_path(self.cache_dir, term)
+            if not create and not os.path.exists(fpath):
+                return None
+            if not os.path.exists(os.path.dirname(fpath)):
+                os.makedirs(os.path.dirname(fpath))
+            catalog = self.catalogs[term] = Catalog(fpath)
+        return catalog
+
+    """
+        The sections of a course from the term's
+        Catalog, or None if its subject wasn't
+        prefetched, didn't list it, or was fetched
+        longer than the ttl ago.
+    """
+    def get_catalog_sections(self, term, subj, crse):
+        catalog = self.get_catalog(term)
+        if catalog is None:
+            return None
+        start = time.time()
+        fetched = catalog.get_fetched(subj)
+        if fetched is None or not (self.offline or self.ttl is None or time.time() - fetched < self.ttl):
+            return None
+        sections = catalog.get_sections(subj + " " + crse)
+        if sections is not None:
+            self.record("aurora.read_catalog", start, "aurora.catalog_hits")
+        return sections
+
+    """
+        Downloads the listing of every section of each
+        subject, workers at a time within the rate limit,
+        and stores them in the term's Catalog. Yields
+        (subject, number of courses) as each is stored.
+    """
+    def prefetch_subjects(self, subjects, term):
+        if self.offline:
+            raise AuroraError("Can't prefetch in offline mode.")
+        catalog = self.get_catalog(term, create=True)
+        paths = dict((get_subject_url_path(term, subj), subj) for subj in subjects)
+        downloads = fetch_all(self.pool, [(path, dict(AURORA_HEADERS)) for path in paths], self.bucket, self.workers)
+        if self.stats:
+            downloads = self.stats.timed("aurora.network", downloads)
+        for path, (status, headers, body) in downloads:
+            if self.stats:
+                self.stats.add("aurora.requests")
+            subj = paths[path]
+            if status != 200 or not body:
+                raise AuroraError("Fatal error: failed to retrieve the sections of subject " + subj)
+            start = time.time()
+            courses = parse_listing_file(StringIO(body))
+            self.record("aurora.parse", start, "aurora.pages_parsed")
+            # Courses of other subjects (cross-listed) are stored with their own subject
+            courses = dict((course, sections) for course, sections in courses.items() if course.split(" ")[0] == subj)
+            catalog.store_subject(subj, courses)
+            yield subj, len(courses)
+
+    """
+        Retrieves the course from Aurora, keeping the
+        sections that satisfy the constraints (a
+        modules.api.Constraints, or None) at every
+        one of their meetings. A course that lists labs
+        keeps its (possibly empty) lab either way, so
+        it can't be taken without one.
+    """
+    def get_course(self, name, term, constraints=None):
+        name = name.upper() # Note that name could be "MATH-1500" or "MATH-1500-A05-A06" etc.
+        subj, crse, specific_sections = split_course_name(name) # Sections specified?
+        course = Course(subj + " " + crse)
+
+        sections = merge_meetings(self.get_course_sections(name, term))
+        if constraints:
+            disallowed = set(section_num for section_num, start, end, section_day in sections
+                    if not constraints.allows(course.name, section_num, start, end))
+        for section_num, start, end, section_day in sections:
+            # Is a section specified?
+            if len(specific_sections) > 0 and section_num not in specific_sections:
+                continue
+
+            # A course that lists labs needs one, even if the constraints allow none
+            if section_num[0] == "B" and not course.haslab:
+                course.haslab = True
+                course.lab = Course(course.name)
+
+            if constraints and section_num in disallowed:
+                continue
+            # It's a course
+            if section_num[0] == "A":
+                course.sections.append(Section(section_num, start, end, section_day, course))
+
+            # It's a lab
+            elif section_num[0] == "B":
+                course.lab.sections.append(Section(section_num, start, end, section_day, course))
+        return course
+
+
+SECTIONS_SUMMARY = "This layout table is used to present the sections found"
+MEETINGS_SUMMARY = "This table lists the scheduled meeting times and assigned instructors for this class.."
+
+# Compiled once, for the tree parser. Each is keyed by the path
+# to a table's rows: "" or, in pages saved by a browser, "tbody/".
+SECTION_ROWS = etree.XPath(".//table[@summary='"+SECTIONS_SUMMARY+"']/tr")
+TITLE_NODES = dict((tbody, etree.XPath(".//table[@summary='"+SECTIONS_SUMMARY+"']/"+tbody+"tr/th[@class='ddtitle']/a")) for tbody in ("", "tbody/"))
+MEETING_ROWS = dict((tbody, etree.XPath("./td/table[@summary='"+MEETINGS_SUMMARY+"']/"+tbody+"tr[position() > 1]")) for tbody in ("", "tbody/"))
+
+"""
+    Parses the lecture and lab sections
+    out of the root of a course page.
+"""
+def parse_course_page(root):
+    nodes = {}
+    """
+        "nodes" refers to the entries in the section table.
+        The table looks like this:
+        <tr><th><a>section title</a></th></tr>
+        <tr><td><a>section body</td></tr>
+        ...
+        We find all title elements (tr/th/a) and
+        associate their titles to the bodies (tr/td)
+        (which are two levels up and one sibling down)
+        using the nodes dict.
+
+        The elements on Aurora don't use IDs, so it's safest
+        to use the long summaries.
+    """
+    # Downloaded HTML files may have tbody elements inserted by the browser.
+    if len(SECTION_ROWS(root)) == 0:
+        tbody = "tbody/"
+    else:
+        tbody = ""
+
+    # NODE EXTRACTION
+    titlenodes = TITLE_NODES[tbody](root)
+
+    for title_a in titlenodes:
+        body_tr = title_a.getparent().getparent().getnext() # From tr/th/a to tr/ and the next tr is the body of the entry.
+        nodes[title_a.text] = [(get_text(row, "./td[2]"), get_text(row, "./td[3]"), get_text(row, "./td[6]")) for row in MEETING_ROWS[tbody](body_tr)]
+
+    return get_sections(nodes)
+
+"""
+    Like parse_course_page, but reads the page at
+    source (a path or file object) in one pass with
+    iterparse, without building the whole tree. Each
+    row of the section table is cleared once read.
+"""
+def parse_course_file(source):
+    return get_sections(read_section_nodes(source))
+
+"""
+    Parses a listing of the sections of many courses,
+    such as a subject's class schedule, from source (a
+    path or file object). Returns a dict of course name
+    ("MATH 1500") : its sections, like parse_course_file.
+"""
+def parse_listing_file(source):
+    by_course = {} # course name : nodes
+    for title, cells in read_section_nodes(source).items():
+        by_course.setdefault(get_title_course(title), {})[title] = cells
+    return dict((course, get_sections(nodes)) for course, nodes in by_course.items())
+
+"""
+    The course in a section title such as
+    "Intro - 104 - COMP 1010 - A04".
+"""
+def get_title_course(title):
+    return title.split(" - ")[-2].strip().upper()
+
+"""
+    The section titles of a page read with iterparse,
+    with the (time, days, schedule type) text of each
+    of their meetings.
+"""
+def read_section_nodes(source):
+    nodes = {}
+    title = None
+    rows = 0 # Rows read of the current meeting table
+    for event, elem in etree.iterparse(source, events=("start", "end"), html=True):
+        tag = elem.tag
+        if event == "start":
+            if tag == "table" and elem.get("summary") == MEETINGS_SUMMARY:
+                rows = 0
+            continue
+
+        if tag == "a":
+            th = elem.getparent()
+            if th.tag == "th" and th.get("class") == "ddtitle" and get_table(th.getparent()).get("summary") == SECTIONS_SUMMARY:
+                title = elem.text
+        elif tag == "tr":
+            table = get_table(elem)
+            summary = table.get("summary")
+            if summary == MEETINGS_SUMMARY:
+                rows += 1
+                if rows == 1 and title is not None:
+                    nodes[title] = []
+                elif title is not None:
+                    cells = elem.findall("td")
+                    nodes[title].append(tuple(cells[i].text if i < len(cells) else None for i in (1, 2, 5)))
+            elif summary == SECTIONS_SUMMARY:
+                # Done with this row of the section table
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    return nodes
+
+def get_text(node, path):
+    found = node.find(path)
+    return found.text if found is not None else None
+
+"""
+    The table a row is in, looking past a tbody.
+"""
+def get_table(tr):
+    parent = tr.getparent()
+    if parent is not None and parent.tag == "tbody":
+        parent = parent.getparent()
+    return parent if parent is not None else tr
+
+"""
+    The sections from a dict of section title : list
+    of (time, days, schedule type) text of its meetings,
+    as (section number, start, end, days) tuples with
+    times in minutes since midnight, keeping only
+    lectures and labs and the meetings at a set time
+    that aren't exams. A section that meets at more
+    than one time gives a tuple for each meeting, one
+    after the other.
+"""
+def get_sections(nodes):
+    sections = []
+    for title,meetings in nodes.items():
+        # Section
+        section_num = title[-3:]
+
+        # Only allow courses and labs
+        if not (section_num[0] == "A" or section_num[0] == "B"):
+            continue
+
+        seen = set() # The same meeting is listed again for each date range
+        for section_time,section_day,schedule_type in meetings:
+            # Finals are listed with the meetings
+            if schedule_type and "Exam" in schedule_type:
+                continue
+
+            # Day
+            if not section_day or ("TBD" in section_day) or ("TBA" in section_day):
+                continue
+
+            # Time
+            if not section_time:
+                continue
+            times = re.split(" *- *", section_time)
+            start_time = time.strptime(times[0], "%I:%M %p")
+            end_time = time.strptime(times[1], "%I:%M %p")
+
+            meeting = (section_num, to_minutes(start_time), to_minutes(end_time), section_day)
+            if meeting not in seen:
+                seen.add(meeting)
+                sections.append(meeting)
+    return sections
+
+"""
+    Merges the meetings of a section that overlap each
+    other, as when Aurora lists a slot again under a
+    date range of its own with other days (e.g. MWF and
+    then M alone). The search takes a section's meetings
+    as one Unit, which ignores conflicts between them,
+    so overlapping ones would count the shared time
+    twice. Each day's overlapping times are joined and
+    the days with the same times are put back together.
+    Sections without overlapping meetings are kept as
+    they are, in place.
+"""
+def merge_meetings(sections):
+    meetings = {} # section number : its meetings
+    for meeting in sections:
+        meetings.setdefault(meeting[0], []).append(meeting)
+    merged = {}   # section number : its merged meetings, for those that overlap
+    for section_num, group in meetings.items():
+        if len(group) > 1:
+            joined = join_meetings(group)
+            if joined is not None:
+                merged[section_num] = joined
+    if not merged:
+        return sections
+
+    result = []
+    done = set()
+    for meeting in sections:
+        section_num = meeting[0]
+        if section_num not in merged:
+            result.append(meeting)
+        elif section_num not in done: # In place of its first meeting
+            done.add(section_num)
+            result.extend(merged[section_num])
+    return result
+
+"""
+    The meetings of one section with the times that
+    overlap on the same day joined, as (section number,
+    start, end, days) tuples by day and time, or None
+    if none of them overlap.
+"""
+def join_meetings(group):
+    section_num = group[0][0]
+    days = {} # day letter : [(start, end)]
+    for _, start, end, day in group:
+        for letter in day:
+            days.setdefault(letter, []).append((start, end))
+    overlap = False
+    slots = [] # [start, end, day letters]
+    for letter in sorted(days, key=lambda letter: DAYS.find(letter) % (len(DAYS) + 1)): # Other letters (-1) last
+        joined = []
+        for start, end in sorted(days[letter]):
+            if joined and start < joined[-1][1]:
+                joined[-1][1] = max(joined[-1][1], end)
+                overlap = True
+            else:
+                joined.append([start, end])
+        for start, end in joined:
+            for slot in slots:
+                if slot[0] == start and slot[1] == end:
+                    slot[2] += letter
+                    break
+            else:
+                slots.append([start, end, letter])
+    if not overlap:
+        return None
+    return [(section_num, start, end, day) for start, end, day in slots]
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import multiprocessing
+
+from modules.aurora import Aurora,AuroraError,split_course_name
+from modules.api import Constraints,get_term_code,normalize_course_name
+from modules.memo import ScheduleMemo
+from modules.sorting import get_sort_key,get_rank_key,top
+from modules.render import Renderer,EXTENSIONS,get_header_lines
+
+MEMO_ENTRIES = 32 # Result lists kept by each process; batches rarely repeat a request exactly
+
+# The JSON type each field of a request must have, if given
+LIST_FIELDS = ("must", "would", "xclude")       # Lists of strings
+INT_FIELDS = ("number", "top")
+STRING_FIELDS = ("term", "earliest", "latest", "sort", "rank")
+
+"""
+    Batch mode: runs many students' requests in one go.
+
+    Requests are read from a file with one JSON object
+    per line (blank lines and lines starting with # are
+    skipped), e.g.
+        {"id": "jsmith", "term": "fall15", "must": ["COMP-1010"],
+         "would": ["MATH-1500", "GEOL-1420"], "number": 2,
+         "earliest": "9:30 AM", "xclude": ["COMP-1010-A01"],
+         "sort": "compress", "free": true, "rank": "free,gap", "top": 50}
+    Everything but term and must is optional, as on the
+    command line. id names the output file and defaults
+    to the line number. A request that isn't an object
+    or whose fields have the wrong types fails by itself
+    (see check_request).
+
+    Every distinct course of the batch is downloaded
+    and parsed once, up front. The requests are then
+    run by jobs processes, each with a ScheduleMemo
+    holding every course in one conflict index, so
+    requests sharing courses share their sections and
+    conflicts, and repeated parts of requests (the same
+    mandatory courses, the same elective subsets) are
+    searched once per process.
+"""
+def run_batch(fpath, outdir, aurora=None, jobs=None, fmt="text"):
+    aurora = aurora or Aurora()
+    requests = read_requests(fpath)
+    failed = load_courses(aurora, requests)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    if jobs and jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, (aurora.cache_dir, aurora.parsed, failed, outdir, fmt))
+        try:
+            for result in pool.imap_unordered(_run, requests):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+    else:
+        memo = ScheduleMemo(aurora, MEMO_ENTRIES)
+        for request in requests:
+            yield run_request(memo, failed, request, outdir, fmt)
+
+def read_requests(fpath):
+    requests = []
+    ids = set()
+    with open(fpath) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise ValueError("Line " + str(line_number) + " of " + fpath + ": " + str(e))
+            if not isinstance(request, dict):
+                request = {"_error": "Line " + str(line_number) + " is not a JSON object."}
+            request["id"] = re.sub(r"[^\w.-]", "_", str(request.get("id", line_number)))
+            if request["id"] in ids:
+                raise ValueError("Line " + str(line_number) + " of " + fpath + ": repeated id " + request["id"])
+            ids.add(request["id"])
+            if "_error" not in request:
+                error = check_request(request)
+                if error:
+                    request["_error"] = error
+            requests.append(request)
+    return requests
+
+"""
+    The error message for a request whose fields
+    have the wrong JSON types, or None.
+"""
+def check_request(request):
+    for field in LIST_FIELDS:
+        value = request.get(field, [])
+        if not isinstance(value, list) or not all(isinstance(i, basestring) for i in value):
+            return "\"" + field + "\" must be a list of strings, e.g. [\"COMP-1010\"]."
+    for field in INT_FIELDS:
+        value = request.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return "\"" + field + "\" must be a whole number, e.g. 2."
+    for field in STRING_FIELDS:
+        value = request.get(field)
+        if value is not None and not isinstance(value, basestring):
+            return "\"" + field + "\" must be a string."
+    return None
+
+"""
+    Downloads (concurrently, within the rate limit) and
+    parses every course the requests use. Returns the
+    (term code, course name) of those that failed, so
+    only the requests using them fail.
+"""
+def load_courses(aurora, requests):
+    names = {} # term code : course names
+    for request in requests:
+        if "_error" in request:
+            continue
+        try:
+            term_code = get_term_code(request.get("term", ""))
+        except ValueError:
+            continue # Reported when the request is run
+        for name in request.get("must", []) + request.get("would", []):
+            name = normalize_course_name(name)
+            try:
+                split_course_name(name)
+            except ValueError:
+                continue # Reported when the request is run
+            names.setdefault(term_code, set()).add(name)
+
+    failed = set()
+    for term_code, term_names in names.items():
+        try:
+            aurora.prefetch_courses(sorted(term_names), term_code)
+        except AuroraError:
+            pass # Courses that didn't download fail below
+        for name in sorted(term_names):
+            try:
+                aurora.get_course_sections(name, term_code)
+            except AuroraError:
+                failed.add((term_code, name))
+    return failed
+
+"""
+    Runs one request and writes its schedules to a file
+    in outdir named after its id. Returns (id, output
+    path, number of schedules, error message or None).
+"""
+def run_request(memo, failed, request, outdir, fmt):
+    request_id = request["id"]
+    if "_error" in request:
+        return request_id, None, 0, request["_error"]
+    try:
+        if not request.get("term"):
+            raise ValueError("You must specify an academic term.")
+        term_code = get_term_code(request["term"])
+        must = request.get("must", [])
+        would = request.get("would", [])
+        for name in must + would:
+            if (term_code, normalize_course_name(name)) in failed:
+                raise AuroraError("Fatal error: failed to retrieve data for course " + name)
+        constraints = Constraints(request.get("earliest"), request.get("latest"), request.get("xclude"))
+        if request.get("rank"):
+            key = get_rank_key(request["rank"])
+        else:
+            key = get_sort_key(request.get("sort", "compress") == "compress", request.get("free", False))
+
+        combs = memo.generate(request["term"], must, would, request.get("number"), constraints)
+        if request.get("top"):
+            count = [0]
+            def counted(combs):
+                for comb in combs:
+                    count[0] += 1
+                    yield comb
+            combs = top(counted(combs), request["top"], key)
+            count = count[0]
+        else:
+            combs = list(combs)
+            count = len(combs)
+            if key:
+                combs.sort(key=key)
+    except (ValueError, AuroraError) as e:
+        return request_id, None, 0, str(e)
+
+    fpath = os.path.join(outdir, request_id + ".out" + EXTENSIONS[fmt])
+    with open(fpath, "wb" if fmt == "binary" else "w") as outfile:
+        renderer = Renderer(outfile, fmt)
+        renderer.header(get_header_lines(count, request.get("sort", "compress") == "compress", request.get("free", False),
+                request.get("rank"), request.get("top")))
+        for comb in combs:
+            renderer.render(comb)
+        renderer.flush()
+    return request_id, fpath, count, None
+
+
+_worker = None # (memo, failed, outdir, format), set in each worker
+
+def _init_worker(cache_dir, parsed, failed, outdir, fmt):
+    global _worker
+    aurora = Aurora(offline=True, cache_dir=cache_dir) # Everything was loaded by the parent
+    aurora.parsed = parsed
+    _worker = (ScheduleMemo(aurora, MEMO_ENTRIES), failed, outdir, fmt)
+
+def _run(request):
+    memo, failed, outdir, fmt = _worker
+    return run_request(memo, failed, request, outdir, fmt)
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import shutil
+
+PARSED_VERSION = 2 # Bump when the parsed section format changes
+
+"""
+    The parsed sections of a course are cached as JSON
+    next to its course page ("MATH-1500.html" ->
+    "MATH-1500.json"), stamped with the page's mtime
+    and size so they are re-parsed when it changes.
+"""
+def get_parsed_path(source_path):
+    return os.path.splitext(source_path)[0] + ".json"
+
+def get_source_stamp(source_path):
+    st = os.stat(source_path)
+    return [st.st_mtime, st.st_size]
+
+"""
+    Loads the cached sections parsed from source_path,
+    or returns None if there are none or they are stale.
+"""
+def load_parsed(source_path):
+    try:
+        with open(get_parsed_path(source_path)) as f:
+            data = json.load(f)
+        if data["version"] != PARSED_VERSION or data["source"] != get_source_stamp(source_path):
+            return None
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    return [(str(name), start, end, str(day)) for name, start, end, day in data["sections"]]
+
+def save_parsed(source_path, sections):
+    if not os.path.exists(source_path):
+        return
+    data = {
+        "version": PARSED_VERSION,
+        "source": get_source_stamp(source_path),
+        "sections": sections,
+    }
+    with open(get_parsed_path(source_path), 'w') as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+###############
+## FRESHNESS ##
+###############
+"""
+    Each cached course page has a ".meta" file with
+    when it was last fetched or revalidated and the
+    validators Aurora sent for it (ETag, Last-Modified).
+"""
+def get_meta_path(source_path):
+    return os.path.splitext(source_path)[0] + ".meta"
+
+def load_meta(source_path):
+    try:
+        with open(get_meta_path(source_path)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+"""
+    Records a fetch of source_path. headers are the
+    response headers (lower case names), or None to
+    keep the validators of the last fetch.
+"""
+def save_meta(source_path, headers=None):
+    meta = load_meta(source_path)
+    if headers is not None:
+        meta = {
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+        }
+    meta["fetched"] = time.time()
+    with open(get_meta_path(source_path), 'w') as f:
+        json.dump(meta, f)
+
+"""
+    Is the cached page younger than ttl seconds?
+    Pages without a .meta file are aged by their
+    mtime. A ttl of None trusts the cache forever.
+"""
+def is_fresh(source_path, ttl):
+    if ttl is None:
+        return True
+    fetched = load_meta(source_path).get("fetched") or os.path.getmtime(source_path)
+    return time.time() - fetched < ttl
+
+"""
+    Headers for a conditional request that Aurora can
+    answer with 304 Not Modified if the page is unchanged.
+"""
+def get_conditional_headers(source_path):
+    meta = load_meta(source_path)
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = str(meta["etag"])
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = str(meta["last_modified"])
+    return headers
+
+
+##############
+## EVICTION ##
+##############
+def _get_dir_stats(path):
+    size = 0
+    newest = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            st = os.stat(os.path.join(dirpath, filename))
+            size += st.st_size
+            newest = max(newest, st.st_mtime)
+    return size, newest
+
+"""
+    Removes the term directories of cache_dir (other
+    than keep, the term in use) that have not been
+    written to in max_age seconds, then the least
+    recently written ones until the cache is no larger
+    than max_bytes. Returns the terms removed.
+"""
+def evict(cache_dir, keep=None, max_age=None, max_bytes=None):
+    if not os.path.isdir(cache_dir):
+        return []
+    terms = [] # (newest mtime, size, term)
+    total = 0
+    for term in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, term)
+        if not os.path.isdir(path):
+            continue
+        size, newest = _get_dir_stats(path)
+        total += size
+        if term != keep:
+            terms.append((newest, size, term))
+    terms.sort()
+
+    removed = []
+    now = time.time()
+    for newest, size, term in terms:
+        too_old = max_age is not None and now - newest > max_age
+        too_big = max_bytes is not None and total > max_bytes
+        if not (too_old or too_big):
+            continue
+        shutil.rmtree(os.path.join(cache_dir, term))
+        total -= size
+        removed.append(term)
+    return removed
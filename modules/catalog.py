@@ -0,0 +1,83 @@
+import os
+import time
+import sqlite3
+import threading
+
+CATALOG_FILE = "catalog.sqlite"
+CATALOG_VERSION = 2 # Bump when the tables change
+
+"""
+    Every section of a term's prefetched subjects, in one
+    SQLite file in the term's cache directory, indexed by
+    course, so looking a course up is one indexed query
+    instead of opening and parsing its page.
+
+    Sections are stored as the (section number, start,
+    end, day) tuples Aurora.get_course_sections returns,
+    in the order they were parsed. Each subject records
+    when it was fetched, for the ttl.
+
+    One connection is shared by every thread of a
+    process, behind a lock.
+"""
+class Catalog:
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fpath, check_same_thread=False)
+        self.db.text_factory = str
+        with self.lock, self.db:
+            version = self.db.execute("PRAGMA user_version").fetchone()[0]
+            if version != CATALOG_VERSION:
+                self.db.executescript("""
+                    DROP TABLE IF EXISTS subjects;
+                    DROP TABLE IF EXISTS courses;
+                    DROP TABLE IF EXISTS sections;
+                    CREATE TABLE subjects (subject TEXT PRIMARY KEY, fetched REAL);
+                    CREATE TABLE courses (course TEXT PRIMARY KEY, subject TEXT);
+                    CREATE TABLE sections (course TEXT, section TEXT, start INTEGER, end INTEGER, day TEXT);
+                    CREATE INDEX sections_course ON sections (course);
+                    PRAGMA user_version = %d;
+                """ % CATALOG_VERSION)
+
+    """
+        Replaces everything stored for subject with
+        courses, a dict of course name ("MATH 1500") :
+        list of sections.
+    """
+    def store_subject(self, subject, courses):
+        with self.lock, self.db:
+            old = [row[0] for row in self.db.execute("SELECT course FROM courses WHERE subject = ?", (subject,))]
+            self.db.executemany("DELETE FROM sections WHERE course = ?", [(course,) for course in old])
+            self.db.execute("DELETE FROM courses WHERE subject = ?", (subject,))
+            self.db.executemany("INSERT OR REPLACE INTO courses VALUES (?, ?)", [(course, subject) for course in courses])
+            self.db.executemany("INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+                    [(course,) + tuple(section) for course, sections in courses.items() for section in sections])
+            self.db.execute("INSERT OR REPLACE INTO subjects VALUES (?, ?)", (subject, time.time()))
+
+    """
+        When subject was last stored, or None.
+    """
+    def get_fetched(self, subject):
+        with self.lock:
+            row = self.db.execute("SELECT fetched FROM subjects WHERE subject = ?", (subject,)).fetchone()
+        return row[0] if row else None
+
+    """
+        The sections of course ("MATH 1500"), or None
+        if its subject's listing didn't have it.
+    """
+    def get_sections(self, course):
+        with self.lock:
+            rows = self.db.execute("SELECT section, start, end, day FROM courses LEFT JOIN sections USING (course)"
+                    " WHERE course = ? ORDER BY sections.rowid", (course,)).fetchall()
+        if not rows:
+            return None
+        return [tuple(row) for row in rows if row[0] is not None]
+
+    def close(self):
+        self.db.close()
+
+def get_catalog_path(cache_dir, term):
+    return os.path.join(cache_dir, term, CATALOG_FILE)
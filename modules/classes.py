@@ -1,3 +1,46 @@
+import time
+
+DAYS = "MTWRF"
+DAY_BITS = dict((letter, 1 << i) for i, letter in enumerate(DAYS)) # M:1 T:2 W:4 R:8 F:16
+DAY_INDEXES = [[d for d in range(5) if mask & (1 << d)] for mask in range(32)] # day mask : list of day numbers
+ALL_DAYS = 31
+
+"""
+    Convert a time.struct_time (or a number of
+    minutes) to minutes since midnight.
+"""
+def to_minutes(t):
+    if isinstance(t, int):
+        return t
+    return t.tm_hour * 60 + t.tm_min
+
+"""
+    Convert minutes since midnight to a
+    time.struct_time like time.strptime gives.
+"""
+def to_struct_time(minutes):
+    return time.strptime("%d:%02d" % divmod(minutes, 60), "%H:%M")
+
+"""
+    Format minutes since midnight like
+    time.strftime("%I:%M %p") would.
+"""
+def format_minutes(minutes):
+    hour, minute = divmod(minutes, 60)
+    return "%02d:%02d %s" % ((hour - 1) % 12 + 1, minute, "AM" if hour < 12 else "PM")
+
+"""
+    Convert a day string such as "MWF" to a
+    5-bit mask, and back.
+"""
+def to_day_mask(day):
+    mask = 0
+    for letter in day:
+        mask |= DAY_BITS.get(letter, 0)
+    return mask
+
+def to_day_string(mask):
+    return "".join(letter for letter in DAYS if mask & DAY_BITS[letter])
 
 
 class Course:
@@ -9,25 +52,53 @@ class Course:
         self.haslab = haslab
         if haslab:
             self.lab = Course(name + "LAB")
+
+        # Lecture section name : names of the lab sections it can be
+        # taken with. None, or a lecture missing from it, allows any lab.
+        self.links = None
     
     
     
     
-class Section:
-    # time_string should be like: 3:30 pm - 3:50
+class Section(object):
+    # start_time/end_time can be time.struct_time or minutes since midnight
     # day should be a string of one of [M T W R F MWF TR]
-    
-    
+    #
+    # Times are stored as minutes since midnight and days as a
+    # bitmask (see DAY_BITS); start_time, end_time and day are
+    # rebuilt from them only when they are needed for output.
+    #
+    # A section that meets at more than one time is one Section
+    # per meeting, all with the same name (see Unit).
+
+    __slots__ = ("name", "days", "start", "end", "root_course", "id", "bit", "conflicts")
 
     def __init__(self, name, start_time, end_time, day, root_course=None):
-        
+
         self.name = name
-        self.day = day
-        self.start_time = start_time
-        self.end_time = end_time
-        
+        self.days = to_day_mask(day)
+        self.start = to_minutes(start_time)
+        self.end = to_minutes(end_time)
+
         self.root_course = root_course #** In practice, this is set later
-    
+
+        # Set by modules.conflicts.build_conflict_index
+        self.id = None
+        self.bit = None
+        self.conflicts = None
+
+    @property
+    def day(self):
+        return to_day_string(self.days)
+
+    @property
+    def start_time(self):
+        return to_struct_time(self.start)
+
+    @property
+    def end_time(self):
+        return to_struct_time(self.end)
+
     """
         If they are on the same day,
         and if one range is neither completely after the other,
@@ -35,8 +106,46 @@ class Section:
         same_day and (StartA <= EndB) and (EndA >= StartB)
     """
     def conflicts_with(self,other):
-        same_day = False
-        for letter in self.day:
-            if letter in other.day:
-                same_day = True
-        return same_day and (self.start_time <= other.end_time) and (self.end_time >= other.start_time)
+        return bool(self.days & other.days) and (self.start <= other.end) and (self.end >= other.start)
+
+
+"""
+    Sections that are taken together, as one option
+    of the search: the meetings of a section that
+    meets at more than one time (each meeting is a
+    Section with the same name), or a lecture and a
+    lab linked to it. It has the bits of all of its
+    sections, and conflicts with everything they
+    conflict with but each other, so it is searched
+    like a section. Make units after the sections
+    are indexed with modules.conflicts.build_conflict_index.
+"""
+class Unit(object):
+
+    __slots__ = ("sections", "bit", "conflicts")
+
+    def __init__(self, options):
+        self.sections = flatten(options)
+        self.bit = 0
+        self.conflicts = 0
+        for section in self.sections:
+            self.bit |= section.bit
+            self.conflicts |= section.conflicts
+        self.conflicts &= ~self.bit
+
+    @property
+    def name(self):
+        return self.sections[0].name
+
+"""
+    The sections of a sequence of sections
+    and units, as a tuple.
+"""
+def flatten(options):
+    sections = []
+    for option in options:
+        if option.__class__ is Unit:
+            sections.extend(option.sections)
+        else:
+            sections.append(option)
+    return tuple(sections)
@@ -0,0 +1,97 @@
+import itertools
+from collections import OrderedDict
+
+from modules.classes import Course,Section
+
+"""
+    Give every section an integer id and a bit
+    (1 << id), and store in each section a bitmask
+    of the bits of every section it conflicts with.
+    Built once per run, after which a conflict test
+    is a single integer AND.
+"""
+def build_conflict_index(sections):
+    sections = list(sections)
+    for i, section in enumerate(sections):
+        section.id = i
+        section.bit = 1 << i
+        section.conflicts = 0
+    for a, b in itertools.combinations(sections, 2):
+        if a.conflicts_with(b):
+            a.conflicts |= b.bit
+            b.conflicts |= a.bit
+    return sections
+
+"""
+    Get every section (lectures and labs) of
+    a list of courses.
+"""
+def get_all_sections(courselist):
+    sections = []
+    for course in courselist:
+        sections.extend(course.sections)
+        if course.haslab:
+            sections.extend(course.lab.sections)
+    return sections
+
+"""
+    Copies of the courses in which interchangeable
+    sections, those meeting at exactly the same times,
+    are one section named after all of them (e.g.
+    "B01/B02"), where the first of them was. They are
+    the same for conflicts and every metric, so the
+    search then finds each schedule once instead of
+    once for every choice among them.
+
+    Courses that link labs to lectures (Course.links)
+    are left as they are.
+"""
+def collapse_equivalent(courselist):
+    collapsed = []
+    for course in courselist:
+        if course.links is not None:
+            collapsed.append(course)
+            continue
+        copy = Course(course.name)
+        copy.sections = collapse_sections(course.sections)
+        if course.haslab:
+            copy.haslab = True
+            copy.lab = Course(course.name)
+            copy.lab.sections = collapse_sections(course.lab.sections)
+        collapsed.append(copy)
+    return collapsed
+
+def collapse_sections(sections):
+    meetings = OrderedDict() # section name : its meetings
+    for section in sections:
+        meetings.setdefault(section.name, []).append(section)
+    classes = OrderedDict()  # meeting times : names of the sections meeting at them
+    for name, group in meetings.items():
+        times = tuple(sorted((section.start, section.end, section.days) for section in group))
+        classes.setdefault(times, []).append(name)
+    if len(classes) == len(meetings):
+        return sections
+    collapsed = []
+    for names in classes.values():
+        for section in meetings[names[0]]:
+            collapsed.append(Section("/".join(names), section.start, section.end, section.day, section.root_course))
+    return collapsed
+
+"""
+    Checks a combination of indexed
+    sections for conflicts.
+"""
+def is_valid_combination(sectionlist):
+    taken = 0
+    for section in sectionlist:
+        if section.conflicts & taken:
+            return False
+        taken |= section.bit
+    return True
+
+"""
+    A cheap, deterministic key for a combination,
+    used to break ties when sorting.
+"""
+def comb_key(comb):
+    return tuple(section.id for section in comb)
@@ -0,0 +1,132 @@
+import time
+import threading
+import httplib
+import socket
+import Queue
+from urlparse import urlsplit
+
+"""
+    Shared wall-clock rate limit: allows rate calls
+    per second on average, with bursts of up to
+    capacity calls. acquire() reserves a token under
+    the lock and sleeps outside it, so any number of
+    threads sharing a bucket are spaced correctly.
+"""
+class TokenBucket:
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+"""
+    A pool of persistent (keep-alive) connections
+    to one host, e.g. "https://aurora.umanitoba.ca".
+    Plain http:// is supported for testing against
+    a local server.
+"""
+class ConnectionPool:
+
+    def __init__(self, base_url, size=4, timeout=30, context=None):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.timeout = timeout
+        self.context = context
+        self.idle = Queue.LifoQueue()
+        self.slots = threading.Semaphore(size)
+
+    def _connect(self):
+        if self.scheme == "https":
+            return httplib.HTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+    """
+        GET path over a pooled connection, retrying
+        once on a fresh connection if the server closed
+        an idle one. Returns (status, headers, body).
+    """
+    def get(self, path, headers={}):
+        self.slots.acquire()
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except Queue.Empty:
+                conn = self._connect()
+            for attempt in range(2):
+                try:
+                    conn.request("GET", path, headers=headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (httplib.HTTPException, socket.error):
+                    conn.close()
+                    if attempt == 1:
+                        raise
+                    conn = self._connect()
+            if response.getheader("connection", "").lower() == "close":
+                conn.close()
+            else:
+                self.idle.put(conn)
+            return response.status, dict(response.getheaders()), body
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+
+"""
+    Fetch (path, headers) requests concurrently with
+    workers threads, calling bucket.acquire() before
+    each one. Yields (path, (status, headers, body))
+    in the order downloads finish, so callers can
+    parse each page while the others are downloading.
+    Exceptions are re-raised in the caller.
+"""
+def fetch_all(pool, requests, bucket=None, workers=4):
+    todo = Queue.Queue()
+    for request in requests:
+        todo.put(request)
+    total = todo.qsize()
+    done = Queue.Queue()
+
+    def work():
+        while True:
+            try:
+                path, headers = todo.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                if bucket:
+                    bucket.acquire()
+                done.put((path, pool.get(path, headers), None))
+            except Exception as e:
+                done.put((path, None, e))
+
+    threads = [threading.Thread(target=work) for i in range(min(workers, total))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for i in range(total):
+        path, result, error = done.get()
+        if error is not None:
+            raise error
+        yield path, result
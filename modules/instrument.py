@@ -0,0 +1,212 @@
+import sys
+import time
+import json
+import atexit
+import cProfile
+
+from modules.search import iter_valid_combinations
+
+PROGRESS_INTERVAL = 0.5 # Seconds between progress line updates
+PROGRESS_CHECK = 1024   # Schedules between checks of the clock
+
+"""
+    Timers and counters for one run, to tell whether
+    a slow query is waiting on Aurora or on the search.
+    Everything is opt-in: code that is given no Stats
+    (None) does no extra work.
+
+    With progress, a live progress line with an ETA is
+    written to stream while schedules are searched.
+"""
+class Stats:
+
+    def __init__(self, progress=False, stream=sys.stderr):
+        self.timers = {}     # name : seconds
+        self.counters = {}   # name : count
+        self.progress = progress
+        self.stream = stream
+        self.started = time.time()
+
+    def add(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    """
+        A context manager adding the time spent in it
+        to the timer name, less any time added to the
+        timer exclude meanwhile (e.g. a search that a
+        sort pulls schedules from).
+    """
+    def timer(self, name, exclude=None):
+        return _Timer(self, name, exclude)
+
+    """
+        Iterate over iterable, adding the time spent
+        waiting for each item to the timer name.
+    """
+    def timed(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, time.time() - start)
+                return
+            self.add_time(name, time.time() - start)
+            yield item
+
+    def report(self):
+        report = {
+            "total": time.time() - self.started,
+            "timers": dict(self.timers),
+            "counters": dict(self.counters),
+        }
+        product = self.counters.get("search.product", 0)
+        if product:
+            report["prune_rate"] = 1 - self.counters.get("search.accepted", 0) / float(product)
+        return report
+
+    def dump(self, fpath):
+        with open(fpath, "w") as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    def summary(self):
+        report = self.report()
+        lines = ["Total: %.2fs" % report["total"]]
+        for name, seconds in sorted(report["timers"].items()):
+            lines.append("  %-24s%9.3fs" % (name, seconds))
+        for name, count in sorted(report["counters"].items()):
+            lines.append("  %-24s%10d" % (name, count))
+        if "prune_rate" in report:
+            lines.append("  %-24s%9.1f%%" % ("search.prune_rate", 100 * report["prune_rate"]))
+        return "\n".join(lines)
+
+
+class _Timer:
+
+    def __init__(self, stats, name, exclude=None):
+        self.stats = stats
+        self.name = name
+        self.exclude = exclude
+
+    def get_excluded(self):
+        return self.stats.timers.get(self.exclude, 0.0) if self.exclude else 0.0
+
+    def __enter__(self):
+        self.excluded = self.get_excluded()
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        elapsed = time.time() - self.start
+        self.stats.add_time(self.name, elapsed - (self.get_excluded() - self.excluded))
+
+class _NoTimer:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+"""
+    stats.timer(name, exclude), or a timer that does
+    nothing if stats is None.
+"""
+def timer(stats, name, exclude=None):
+    if stats is None:
+        return _NoTimer()
+    return stats.timer(name, exclude)
+
+
+"""
+    Like searching each subset's section lists in turn
+    with iter_valid_combinations, counting what the
+    search does in stats:
+        search.subsets   subsets of would searched
+        search.product   tuples in their Cartesian products
+        search.examined  partial schedules the search built
+        search.accepted  valid schedules found
+    The prune rate is the share of the product that was
+    never built. With stats.progress, a progress line
+    estimates how much of the total product is done.
+"""
+def instrumented_combinations(s_lists_seq, stats):
+    s_lists_seq = list(s_lists_seq)
+    products = [product_size(s_lists) for s_lists in s_lists_seq]
+    total = float(sum(products)) or 1.0
+    done = 0 # Product of the finished subsets
+    accepted = 0
+    last_shown = 0
+    start = time.time()
+
+    for subset, s_lists in enumerate(s_lists_seq):
+        stats.add("search.subsets")
+        stats.add("search.product", products[subset])
+        if not s_lists:
+            continue
+        visits = [0] * len(s_lists)
+        for comb in iter_valid_combinations(s_lists, visits):
+            accepted += 1
+            yield comb
+            if stats.progress and accepted % PROGRESS_CHECK == 0 and time.time() - last_shown >= PROGRESS_INTERVAL:
+                last_shown = time.time()
+                # Visits to the first list are how far along it the search is
+                position = done + products[subset] * visits[0] / float(len(s_lists[0]))
+                show_progress(stats.stream, position / total, start, subset, len(s_lists_seq), accepted)
+        stats.add("search.examined", sum(visits))
+        done += products[subset]
+
+    stats.add("search.accepted", accepted)
+    if stats.progress:
+        show_progress(stats.stream, 1.0, start, len(s_lists_seq) - 1, len(s_lists_seq), accepted)
+        stats.stream.write("\n")
+
+def product_size(s_lists):
+    size = 1 if s_lists else 0
+    for options in s_lists:
+        size *= len(options)
+    return size
+
+def show_progress(stream, fraction, start, subset, subsets, accepted):
+    elapsed = time.time() - start
+    if fraction > 0:
+        eta = format_seconds(elapsed * (1 - fraction) / fraction)
+    else:
+        eta = "?"
+    stream.write("\rSearching: %3d%%  subset %d/%d  %d schedules  ETA %s    "
+            % (100 * fraction, subset + 1, subsets, accepted, eta))
+    stream.flush()
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+"""
+    Counts the schedules passing through combs
+    as search.accepted, for searches that aren't
+    instrumented themselves.
+"""
+def counted_combinations(combs, stats):
+    accepted = 0
+    for comb in combs:
+        accepted += 1
+        yield comb
+    stats.add("search.accepted", accepted)
+
+
+"""
+    Profile the rest of the run with cProfile and
+    write the profile to fpath when the program
+    exits, for reading with pstats or snakeviz.
+"""
+def start_profile(fpath):
+    profile = cProfile.Profile()
+    atexit.register(profile.dump_stats, fpath)
+    atexit.register(profile.disable) # atexit runs last registered first
+    profile.enable()
+    return profile
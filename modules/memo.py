@@ -0,0 +1,189 @@
+import time
+import itertools
+import threading
+from collections import OrderedDict
+
+from modules.aurora import Aurora
+from modules.api import Constraints,prepare_request
+from modules.search import get_section_lists,iter_valid_combinations
+from modules.conflicts import get_all_sections
+from modules.classes import flatten
+
+MAX_ENTRIES = 256 # Result lists kept by a ScheduleMemo
+
+"""
+    Remembers courses and results between queries, for a
+    long-running process where users try variations of
+    the same request.
+
+    Courses are loaded once, with all their sections, and
+    indexed into one conflict index that grows as courses
+    are added, so their sections are the same objects in
+    every query. Results are kept per (term, mandatory
+    courses, elective subset) and constraints:
+      - the valid schedules of the mandatory courses alone
+        (the core) are found once, and each schedule of an
+        elective subset is extended by every core schedule
+        whose bits it doesn't conflict with;
+      - swapping one elective only searches the subsets
+        that contain the new course;
+      - tighter constraints (a later earliest, an earlier
+        latest, more excluded sections) filter the results
+        kept for looser ones instead of searching again.
+
+    With the Aurora's ttl, a course loaded longer ago
+    is revalidated when a query uses it, and if its
+    sections changed, it is loaded again and the results
+    that used it are dropped.
+"""
+class ScheduleMemo:
+
+    def __init__(self, aurora=None, max_entries=MAX_ENTRIES):
+        self.aurora = aurora or Aurora()
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.courses = {}           # (term code, course name) : Course
+        self.loaded = {}            # (term code, course name) : (time loaded, its sections from Aurora)
+        self.sections = []          # Every indexed section, by id
+        self.results = OrderedDict() # (term code, must, subset) : [(constraints, combs)], least recently used first
+
+    """
+        Like modules.api.generate, from remembered
+        courses and results where possible. Schedules
+        come in the same order as from generate, with
+        the elective sections first, then the mandatory
+        ones.
+    """
+    def generate(self, term, must, would=None, number=None, constraints=None):
+        aurora, term_code, must, would, number = prepare_request(term, must, would, number, self.aurora)
+        must = tuple(must)
+        would = tuple(would)
+        constraints = constraints or Constraints()
+
+        with self.lock:
+            stale = [name for name in must + would if self.is_stale(term_code, name)]
+            for name in stale:
+                self.aurora.expire(name, term_code)
+            self.aurora.prefetch_courses([name for name in must + would if (term_code, name) not in self.courses] + stale, term_code)
+            for name in stale:
+                self.reload(term_code, name)
+            m_courses = [self.get_course(term_code, name) for name in must]
+            p_courses = dict((name, self.get_course(term_code, name)) for name in would)
+
+        core = self._get((term_code, must, None), constraints,
+            lambda: list(iter_valid_combinations(self._filter(m_courses, constraints))))
+        for subset in itertools.combinations(would, number - len(must)):
+            courselist = [p_courses[name] for name in subset]
+            combs = self._get((term_code, must, subset), constraints,
+                lambda: self._extend(core, courselist, constraints))
+            for comb in combs:
+                if len(comb) > 0:
+                    yield comb
+
+    """
+        Gets a course with all its sections,
+        loading and indexing it the first time.
+    """
+    def get_course(self, term_code, name):
+        with self.lock:
+            key = (term_code, name)
+            if key not in self.courses:
+                course = self.aurora.get_course(name, term_code)
+                self._index(get_all_sections([course]))
+                self.courses[key] = course
+                self.loaded[key] = (time.time(), self.aurora.get_course_sections(name, term_code))
+            return self.courses[key]
+
+    """
+        Was the course loaded longer than the
+        Aurora's ttl ago?
+    """
+    def is_stale(self, term_code, name):
+        key = (term_code, name)
+        if key not in self.loaded or self.aurora.offline or self.aurora.ttl is None:
+            return False
+        return time.time() - self.loaded[key][0] >= self.aurora.ttl
+
+    """
+        Gets the course's sections from Aurora again.
+        If they changed, the course is forgotten, to be
+        loaded again, with every result that used it.
+    """
+    def reload(self, term_code, name):
+        key = (term_code, name)
+        sections = self.aurora.get_course_sections(name, term_code)
+        if sections == self.loaded[key][1]:
+            self.loaded[key] = (time.time(), sections)
+            return
+        del self.courses[key]
+        del self.loaded[key]
+        for result_key in list(self.results):
+            result_term, must, subset = result_key
+            if result_term == term_code and (name in must or name in (subset or ())):
+                del self.results[result_key]
+
+    def _index(self, new_sections):
+        for section in new_sections:
+            section.id = len(self.sections)
+            section.bit = 1 << section.id
+            section.conflicts = 0
+            for other in self.sections:
+                if section.conflicts_with(other):
+                    section.conflicts |= other.bit
+                    other.conflicts |= section.bit
+            self.sections.append(section)
+
+    def _filter(self, courselist, constraints):
+        return [[option for option in options if all(constraints.allows_section(section) for section in flatten((option,)))]
+                for options in get_section_lists(courselist)]
+
+    """
+        Each valid way of taking the courses in
+        courselist extended by every core schedule it
+        doesn't conflict with. The core lists are the
+        last ones generate searches, so this is the
+        order generate finds the schedules in.
+    """
+    def _extend(self, core, courselist, constraints):
+        s_lists = self._filter(courselist, constraints)
+        core_bits = []
+        for core_comb in core:
+            bits = 0
+            for section in core_comb:
+                bits |= section.bit
+            core_bits.append((bits, core_comb))
+        combs = []
+        for comb in iter_valid_combinations(s_lists):
+            conflicts = 0
+            for section in comb:
+                conflicts |= section.conflicts
+            combs.extend(comb + core_comb for bits, core_comb in core_bits if not bits & conflicts)
+        return combs
+
+    """
+        The results for key under constraints: remembered,
+        filtered from results for looser constraints, or
+        else computed with compute().
+    """
+    def _get(self, key, constraints, compute):
+        combs = None
+        with self.lock:
+            entries = self.results.pop(key, [])
+            self.results[key] = entries # Most recently used
+            for cached, cached_combs in entries:
+                if cached.key() == constraints.key():
+                    return cached_combs
+            for cached, cached_combs in entries:
+                if constraints.within(cached):
+                    combs = [comb for comb in cached_combs if all(constraints.allows_section(section) for section in comb)]
+                    break
+        if combs is None:
+            combs = compute()
+        with self.lock:
+            self.results.setdefault(key, []).append((constraints, combs))
+            while sum(len(entries) for entries in self.results.values()) > self.max_entries:
+                oldest = next(iter(self.results))
+                self.results[oldest].pop(0)
+                if not self.results[oldest]:
+                    del self.results[oldest]
+        return combs
@@ -0,0 +1,73 @@
+import multiprocessing
+
+from modules.search import iter_valid_combinations
+from modules.classes import flatten
+
+TASKS_PER_JOB = 4 # With few subsets, split them until each worker has about this many tasks
+
+_s_lists_seq = None # The section lists of each subset, set in each worker
+
+def _init_worker(s_lists_seq):
+    global _s_lists_seq
+    _s_lists_seq = s_lists_seq
+
+"""
+    Search part of a subset in a worker: the
+    schedules whose first section is one of
+    s_lists[0][start:stop]. Returns them as
+    tuples of section ids, which are cheap to
+    send back to the parent process.
+"""
+def _search(task):
+    subset, start, stop = task
+    s_lists = _s_lists_seq[subset]
+    s_lists = [s_lists[0][start:stop]] + s_lists[1:]
+    found = []
+    for comb in iter_valid_combinations(s_lists):
+        found.append(tuple(section.id for section in comb))
+    return subset, found
+
+"""
+    Split each subset into tasks over slices of its
+    first section list, so there are enough tasks to
+    keep every worker busy even with one subset.
+"""
+def _make_tasks(s_lists_seq, jobs):
+    pieces = max(1, (jobs * TASKS_PER_JOB) // max(1, len(s_lists_seq)))
+    tasks = []
+    for subset, s_lists in enumerate(s_lists_seq):
+        if not s_lists:
+            continue
+        first = len(s_lists[0])
+        size = max(1, -(-first // pieces)) # ceil(first / pieces)
+        for start in range(0, first, size):
+            tasks.append((subset, start, start + size))
+    return tasks
+
+"""
+    Like searching each subset's section lists in turn
+    with iter_valid_combinations, but with the subsets
+    fanned out to a pool of jobs worker processes.
+
+    Results are merged in task order, so combinations
+    are yielded in the same order as a serial search.
+    The sections must have been indexed with
+    modules.conflicts.build_conflict_index.
+"""
+def parallel_combinations(s_lists_seq, jobs):
+    s_lists_seq = list(s_lists_seq)
+    sections = {}   # section id : section
+    for s_lists in s_lists_seq:
+        for options in s_lists:
+            for section in flatten(options):
+                sections[section.id] = section
+
+    tasks = _make_tasks(s_lists_seq, jobs)
+    pool = multiprocessing.Pool(jobs, _init_worker, (s_lists_seq,))
+    try:
+        for subset, found in pool.imap(_search, tasks):
+            for ids in found:
+                yield tuple(sections[i] for i in ids)
+        pool.close()
+    finally:
+        pool.terminate()
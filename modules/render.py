@@ -0,0 +1,244 @@
+import csv
+import json
+import struct
+from StringIO import StringIO
+
+from modules.classes import DAY_INDEXES,format_minutes,to_day_string
+
+FORMATS = ("text", "jsonl", "csv", "binary")
+EXTENSIONS = {"text": ".txt", "jsonl": ".jsonl", "csv": ".csv", "binary": ".bin"}
+FLUSH_SIZE = 1 << 16 # Characters buffered before they are written out
+
+SCHEDULE_TITLE = "**************  SCHEDULE  *******************\n"
+CALENDAR_TITLE = ("*********************  CALENDAR  **********************\n"
+                  "| MONDAY  || TUESDAY ||WEDNESDAY||THURSDAY || FRIDAY  |\n")
+CALENDAR_RULE = "|---------||---------||---------||---------||---------|\n"
+EMPTY_CELL = "|         |"
+
+CSV_COLUMNS = ["schedule", "course", "section", "start", "end", "day"]
+
+COLLAPSE_LINE = "- Sections that meet at the same times are listed together, e.g. B01/B02. (--collapse)"
+
+"""
+    The lines describing count schedules at the top
+    of text output (see Renderer.header), the same for
+    the command line and batches. complete is False if
+    a budget stopped the search early.
+"""
+def get_header_lines(count, compression=True, free_days=False, rank=None, top=None, collapse=False, complete=True):
+    lines = ["- Generated "+str(count)+" schedules."]
+    if rank:
+        lines.append("- These schedules are ranked by "+rank+". (--rank)")
+    else:
+        if compression:
+            lines.append("- These schedules are sorted by most compression to least compression.")
+        if free_days:
+            lines.append("- Schedules with free days are listed first. (--prefer-free-days)")
+    if collapse:
+        lines.append(COLLAPSE_LINE)
+    if top and top < count:
+        lines.append("- Only the first "+str(top)+" of these schedules are listed. (--top)")
+    if not complete:
+        lines.append("- The search stopped at the --cap/--time-limit budget, so there are more schedules than these.")
+    lines.append("\n\n")
+    return lines
+
+"""
+    The binary format is a magic line followed by records:
+        "S" id start end days course section
+            a section, the first time it is used, with
+            id, start, end (minutes) as unsigned shorts,
+            days as a byte (see DAY_BITS) and the names
+            as a length byte followed by the name
+        "C" n id*n
+            a schedule of n sections by id, with n as a
+            byte and the ids as unsigned shorts
+    All numbers are little-endian. See read_binary.
+"""
+BINARY_MAGIC = "AURORACLE1\n"
+SECTION_RECORD = struct.Struct("<HHHB")
+
+"""
+    Writes schedules to a file in one of FORMATS.
+
+    Everything that only depends on a section (its line
+    in the list, its calendar cells, its JSON or CSV, and
+    the days it is on) is rendered the first time the
+    section is seen and reused for every schedule it is
+    in. Output is buffered and written in large chunks,
+    so call flush() when done.
+"""
+class Renderer:
+
+    def __init__(self, outfile, fmt="text"):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown output format: " + fmt)
+        self.outfile = outfile
+        self.format = fmt
+        self.parts = []
+        self.size = 0
+        self.count = 0       # Schedules rendered
+        self.sections = {}   # section : its pre-rendered pieces
+        self.render_section = getattr(self, "_" + fmt + "_section")
+        self.render_comb = getattr(self, "_" + fmt + "_comb")
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write("".join(self.parts))
+        self.parts = []
+        self.size = 0
+
+    """
+        Starts the output. Text output gets lines
+        describing the schedules, the other formats
+        get their own header instead.
+    """
+    def header(self, lines):
+        if self.format == "text":
+            self.write("".join(line + "\n" for line in lines))
+        elif self.format == "csv":
+            self.write(",".join(CSV_COLUMNS) + "\n")
+        elif self.format == "binary":
+            self.write(BINARY_MAGIC)
+
+    def render(self, comb):
+        sections = self.sections
+        pieces = []
+        for section in comb:
+            piece = sections.get(section)
+            if piece is None:
+                piece = sections[section] = self.render_section(section)
+            pieces.append(piece)
+        self.count += 1
+        self.render_comb(pieces)
+
+    ##########
+    ## TEXT ##
+    ##########
+
+    def _text_section(self, section):
+        course = section.root_course.name
+        start = format_minutes(section.start)
+        line = course + " : " + section.name + "    " + start + " - " + format_minutes(section.end) + "    " + section.day + "\n"
+        name = section.name
+        if len(name) > 9: # Collapsed sections (see conflicts.collapse_equivalent), e.g. "A01+3"
+            names = name.split("/")
+            name = names[0] + "+" + str(len(names) - 1)
+        cells = ("|" + course.ljust(9) + "|", "|" + name.center(9) + "|", "|" + start.center(9) + "|")
+        return section.start, line, cells, DAY_INDEXES[section.days]
+
+    def _text_comb(self, pieces):
+        parts = [SCHEDULE_TITLE]
+        day_lists = [[], [], [], [], []]
+        for piece in pieces:
+            parts.append(piece[1])
+        for piece in sorted(pieces): # By start time, so each day fills in order
+            for day in piece[3]:
+                day_lists[day].append(piece)
+        parts.append("\n\n")
+        parts.append(CALENDAR_TITLE)
+
+        for row in range(max(len(day_list) for day_list in day_lists)):
+            parts.append(CALENDAR_RULE)
+            cells = [day_list[row][2] if row < len(day_list) else None for day_list in day_lists]
+            for line in range(3):
+                parts.append("".join(cell[line] if cell else EMPTY_CELL for cell in cells))
+                parts.append("\n")
+        parts.append(CALENDAR_RULE)
+        parts.append("\n\n\n\n\n\n")
+        self.write("".join(parts))
+
+    ###########
+    ## JSONL ##
+    ###########
+
+    def _jsonl_section(self, section):
+        return json.dumps(section_to_json(section))
+
+    def _jsonl_comb(self, pieces):
+        self.write("[" + ",".join(pieces) + "]\n")
+
+    #########
+    ## CSV ##
+    #########
+
+    def _csv_section(self, section):
+        row = StringIO()
+        csv.writer(row, lineterminator="\n").writerow([section.root_course.name, section.name,
+                format_minutes(section.start), format_minutes(section.end), section.day])
+        return row.getvalue()
+
+    def _csv_comb(self, pieces):
+        prefix = str(self.count) + ","
+        self.write("".join(prefix + piece for piece in pieces))
+
+    ############
+    ## BINARY ##
+    ############
+
+    def _binary_section(self, section):
+        i = len(self.sections)
+        self.write("S" + SECTION_RECORD.pack(i, section.start, section.end, section.days)
+                + pack_name(section.root_course.name) + pack_name(section.name))
+        return i
+
+    def _binary_comb(self, pieces):
+        self.write("C" + struct.pack("<B%dH" % len(pieces), len(pieces), *pieces))
+
+
+def pack_name(name):
+    return chr(len(name)) + name
+
+"""
+    A section as a JSON object.
+"""
+def section_to_json(section):
+    return {
+        "course": section.root_course.name,
+        "section": section.name,
+        "start": format_minutes(section.start),
+        "end": format_minutes(section.end),
+        "day": section.day,
+    }
+
+"""
+    A combination of sections as a list of JSON objects.
+"""
+def comb_to_json(comb):
+    return [section_to_json(section) for section in comb]
+
+"""
+    Reads schedules written in the binary format.
+    Yields each schedule as a list of JSON objects,
+    like comb_to_json.
+"""
+def read_binary(f):
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not a schedule file.")
+    def read_name():
+        return f.read(ord(f.read(1)))
+    sections = {}
+    while True:
+        kind = f.read(1)
+        if not kind:
+            return
+        if kind == "S":
+            i, start, end, days = SECTION_RECORD.unpack(f.read(SECTION_RECORD.size))
+            course = read_name()
+            sections[i] = {
+                "course": course,
+                "section": read_name(),
+                "start": format_minutes(start),
+                "end": format_minutes(end),
+                "day": to_day_string(days),
+            }
+        elif kind == "C":
+            n = ord(f.read(1))
+            yield [sections[i] for i in struct.unpack("<%dH" % n, f.read(2 * n))]
+        else:
+            raise ValueError("Bad record in schedule file.")
@@ -0,0 +1,441 @@
+import time
+import heapq
+from collections import deque
+
+from modules.classes import DAY_INDEXES,ALL_DAYS,Unit,flatten
+from modules.sorting import get_metrics
+
+BUDGET_CHECK = 4096 # Partial schedules between checks of a budget's time limit
+
+"""
+    Build the list of section lists for a list
+    of courses. Each course contributes its
+    lecture sections, and its lab sections
+    as a separate list if it has a lab.
+
+    The meetings of a section that meets at more
+    than one time are one Unit. If the course links
+    its lectures to labs, it contributes a single
+    list instead: a Unit for each lecture and each
+    lab it can be taken with, so lab and lecture
+    pairs that can't be registered in (or that
+    conflict) are never searched.
+
+    The sections must have been indexed with
+    modules.conflicts.build_conflict_index.
+"""
+def get_section_lists(courselist):
+    s_lists = []
+    for course in courselist:
+        lectures = group_meetings(course.sections)
+        # Lab?
+        if not course.haslab:
+            s_lists.append(lectures)
+        elif course.links is None:
+            s_lists.append(lectures)
+            s_lists.append(group_meetings(course.lab.sections))
+        else:
+            s_lists.append(link_labs(lectures, group_meetings(course.lab.sections), course.links))
+    return s_lists
+
+"""
+    The sections as options for the search: each
+    section, or a Unit of the meetings of sections
+    with more than one, in the order of the first.
+"""
+def group_meetings(sections):
+    meetings = {} # section name : its meetings
+    for section in sections:
+        meetings.setdefault(section.name, []).append(section)
+    if len(meetings) == len(sections):
+        return sections
+    options = []
+    for section in sections:
+        group = meetings.pop(section.name, None)
+        if group is not None:
+            options.append(group[0] if len(group) == 1 else Unit(group))
+    return options
+
+"""
+    A Unit for each lecture and each lab it is
+    linked to (see Course.links) and doesn't
+    conflict with.
+"""
+def link_labs(lectures, labs, links):
+    units = []
+    for lecture in lectures:
+        allowed = links.get(lecture.name)
+        for lab in labs:
+            if (allowed is None or lab.name in allowed) and not lecture.conflicts & lab.bit:
+                units.append(Unit((lecture, lab)))
+    return units
+
+
+"""
+    Depth-first search over the section lists.
+    One section list is assigned at a time, and
+    a branch is abandoned as soon as the newly
+    assigned section conflicts with one already
+    chosen, so a conflict between the first two
+    lists is found once instead of once for every
+    tuple that contains it.
+
+    Schedules are yielded in the same order that
+    itertools.product(*s_lists) would produce them,
+    as tuples of sections, with units flattened.
+    The sections must have been indexed with
+    modules.conflicts.build_conflict_index.
+
+    visits, if given, is a list with
+    a counter for each level, counting the sections
+    assigned there (partial schedules examined).
+    budget, if given, is a Budget whose time limit
+    stops the search even while it finds nothing.
+"""
+def iter_valid_combinations(s_lists, visits=None, budget=None):
+    depth = len(s_lists)
+    if depth == 0:
+        yield ()
+        return
+
+    units = any(option.__class__ is Unit for options in s_lists for option in options)
+    chosen = [None] * depth    # The partial schedule, chosen[:level] is assigned
+    taken = [0] * (depth + 1)  # taken[level] is the bits of chosen[:level]
+    indices = [0] * depth      # Next section to try in each list
+    steps = 0
+    level = 0
+    while level >= 0:
+        if budget is not None:
+            steps += 1
+            if steps % BUDGET_CHECK == 0 and budget.out_of_time():
+                return
+        options = s_lists[level]
+        n = len(options)
+        i = indices[level]
+        mask = taken[level]
+        section = None
+        while i < n:
+            candidate = options[i]
+            i += 1
+            if not candidate.conflicts & mask:
+                section = candidate
+                break
+
+        if section is None: # List exhausted, backtrack
+            indices[level] = 0
+            level -= 1
+            continue
+
+        indices[level] = i
+        chosen[level] = section
+        if visits is not None:
+            visits[level] += 1
+        if level == depth - 1:
+            yield flatten(chosen) if units else tuple(chosen)
+        else:
+            taken[level + 1] = mask | section.bit
+            level += 1
+
+
+"""
+    Counts the schedules iter_valid_combinations
+    would yield, without enumerating them.
+
+    Whether a partial schedule can be completed depends
+    only on the chosen sections that conflict with some
+    section of a later list, so the count from each
+    level is memoized on those bits. Partial schedules
+    that differ only in sections nothing later can
+    conflict with are counted once.
+"""
+def count_valid_combinations(s_lists):
+    depth = len(s_lists)
+    relevant = [0] * (depth + 1) # relevant[level]: bits that can conflict with lists level onwards
+    for level in reversed(range(depth)):
+        mask = relevant[level + 1]
+        for section in s_lists[level]:
+            mask |= section.conflicts
+        relevant[level] = mask
+    memo = [{} for level in range(depth)]
+
+    def count(level, taken):
+        if level == depth:
+            return 1
+        key = taken & relevant[level]
+        total = memo[level].get(key)
+        if total is None:
+            total = 0
+            for section in s_lists[level]:
+                if not section.conflicts & taken:
+                    total += count(level + 1, taken | section.bit)
+            memo[level][key] = total
+        return total
+
+    return count(0, 0)
+
+
+#############
+## BUDGETS ##
+#############
+
+"""
+    A limit on a whole search, across every subset:
+    at most cap valid schedules and/or time_limit
+    seconds from when the search starts. complete is
+    False once the search stopped with schedules it
+    didn't get to. A cap of 0 is no cap.
+"""
+class Budget:
+
+    def __init__(self, cap=None, time_limit=None):
+        self.cap = cap or None
+        self.time_limit = time_limit
+        self.deadline = None
+        self.taken = 0
+        self.complete = True
+
+    def limited(self):
+        return self.cap is not None or self.time_limit is not None
+
+    def start(self):
+        if self.time_limit is not None:
+            self.deadline = time.time() + self.time_limit
+
+    def out_of_time(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+"""
+    Searches every subset's section lists within a
+    budget, taking one schedule from each subset in
+    turn, so a budget that runs out leaves every
+    subset represented instead of only the first few.
+
+    The time limit is checked between schedules and
+    within each subset's search, so a subset that finds
+    nothing for a long time can't overrun it.
+    When the cap is reached, the remaining subsets
+    are searched for one more schedule, so the budget
+    is only marked incomplete if one exists.
+"""
+def fair_combinations(s_lists_seq, budget):
+    budget.start()
+    searches = deque(iter_valid_combinations(s_lists, budget=budget) for s_lists in s_lists_seq if s_lists)
+    while searches:
+        if budget.out_of_time():
+            budget.complete = False
+            return
+        search = searches.popleft()
+        comb = next(search, None)
+        if comb is None:
+            if budget.out_of_time(): # Its search stopped at the time limit
+                budget.complete = False
+                return
+            continue # This subset is exhausted
+        if budget.cap is not None and budget.taken >= budget.cap:
+            budget.complete = False
+            return
+        budget.taken += 1
+        yield comb
+        searches.append(search)
+
+"""
+    Orders each section list so that sections meeting
+    closest to the middle of all of them come first.
+    A budgeted search then reaches compact schedules,
+    which are ranked first, before spread out ones.
+"""
+def compact_first(s_lists):
+    sections = flatten(option for options in s_lists for option in options)
+    if not sections:
+        return s_lists
+    middle = sum(section.start + section.end for section in sections) / (2.0 * len(sections))
+    def distance(option):
+        sections = flatten((option,))
+        return abs(sum(section.start + section.end for section in sections) / (2.0 * len(sections)) - middle)
+    return [sorted(options, key=distance) for options in s_lists]
+
+
+######################
+## BRANCH AND BOUND ##
+######################
+
+"""
+    Finds the n best combinations over several lists
+    of section lists (one per elective subset) without
+    enumerating every valid combination.
+
+    A combination's key is (idle minutes,), the total
+    time between classes over the week, or with
+    free_days (-free days, idle minutes). Lower is better.
+
+    Each partial schedule gets an optimistic bound on
+    the key of any schedule that extends it, and is
+    cut once it cannot beat the n-th best schedule
+    found so far. Options are tried best bound first,
+    so good schedules are found early. The incumbent
+    is shared by all subsets, so whole subsets are
+    cut at their root.
+
+    Returns the n best combinations in key order, ties
+    broken by the order they would be generated in.
+"""
+def best_combinations(s_lists_seq, n, free_days=False):
+    best = []   # Heap of (negated key, -subset, -order, comb); best[0] is the worst kept
+    for subset, s_lists in enumerate(s_lists_seq):
+        _branch_and_bound(s_lists, n, free_days, best, subset)
+    best.sort(reverse=True)
+    return [comb for _, _, _, comb in best]
+
+
+"""
+    The exact key best_combinations gives
+    a complete combination.
+"""
+def idle_key(comb, free_days=False):
+    metrics = get_metrics(comb)
+    if free_days:
+        return (-metrics.free, metrics.gap)
+    return (metrics.gap,)
+
+
+def _branch_and_bound(s_lists, n, free_days, best, subset):
+    depth = len(s_lists)
+    if depth == 0:
+        return
+
+    # step[i]: how far apart in generation order schedules that differ
+    #          only in the option of list i are.
+    step = [1] * depth
+    for i in reversed(range(depth - 1)):
+        step[i] = step[i + 1] * len(s_lists[i + 1])
+
+    # Each list as (its index, its step, its options as (option, its
+    # sections, the days they meet on, their (start, end) on each day)).
+    # Lists with the most class time are searched first: they spread
+    # the days out early, so the bounds rise sooner.
+    levels = []
+    for i, options in enumerate(s_lists):
+        if not options: # No way to take this course
+            return
+        level = []
+        for option in options:
+            sections = flatten((option,))
+            days = 0
+            spans = [[] for d in range(5)]
+            for section in sections:
+                days |= section.days
+                for d in DAY_INDEXES[section.days]:
+                    spans[d].append((section.start, section.end))
+            level.append((option, sections, days, spans))
+        levels.append((i, step[i], level))
+    def class_time(level):
+        return max(sum(end - start for classes in spans for start, end in classes) for option, sections, days, spans in level[2])
+    levels.sort(key=class_time, reverse=True)
+
+    # forced[level]:   days every choice of some list from level onwards
+    #                  meets on, which cannot stay free.
+    # daily[level][d]: (conflicts, (start, end) on day d) of each option
+    #                  of list level meeting on day d, and the most class
+    #                  time any of them has on it.
+    forced = [0] * (depth + 1)
+    for level in reversed(range(depth)):
+        common = ALL_DAYS
+        for option, sections, days, spans in levels[level][2]:
+            common &= days
+        forced[level] = forced[level + 1] | common
+    daily = []
+    for i, i_step, options in levels:
+        daily.append([])
+        for d in range(5):
+            meeting = [(option.conflicts, spans[d]) for option, sections, days, spans in options if spans[d]]
+            longest = max([sum(end - start for start, end in classes) for conflicts, classes in meeting] or [0])
+            daily[-1].append((meeting, longest))
+
+    # The most of the idle time between lo and hi on day d the lists
+    # from level onwards can fill: for each list, the most class time
+    # any option not conflicting with taken has between them. Classes
+    # outside lengthen the day as much as they fill.
+    def fill(level, taken, d, lo, hi, idle):
+        filled = 0
+        for days in daily[level:]:
+            meeting, longest = days[d]
+            most = 0
+            for conflicts, classes in meeting:
+                if conflicts & taken:
+                    continue
+                inside = 0
+                for start, end in classes:
+                    if start < hi and end > lo:
+                        inside += (end if end < hi else hi) - (start if start > lo else lo)
+                if inside > most:
+                    most = inside
+                    if most == longest:
+                        break
+            filled += most
+            if filled >= idle:
+                return idle
+        return filled
+
+    def bound(level, taken, days, busy, lo, hi):
+        free = len(DAY_INDEXES[ALL_DAYS & ~(days | forced[level])])
+        if free_days and len(best) == n and -free > -best[0][0][0]:
+            return (-free, 0) # Cut on free days alone
+        idle = 0
+        for d in DAY_INDEXES[days]:
+            gap = hi[d] - lo[d] - busy[d]
+            if gap > 0 and level < depth:
+                gap -= fill(level, taken, d, lo[d], hi[d], gap)
+            idle += gap
+        if free_days:
+            return (-free, idle)
+        return (idle,)
+
+    # Whether no schedule with this key, at or after this point in
+    # generation order, can take the place of the worst one kept.
+    def cut(key, order):
+        if len(best) < n:
+            return False
+        worst = best[0]
+        return (key, subset, order) >= (tuple(-k for k in worst[0]), -worst[1], -worst[2])
+
+    chosen = [None] * depth
+
+    def visit(level, taken, days, busy, lo, hi, order):
+        i, i_step, options = levels[level]
+        children = []
+        for index, (option, sections, option_days, spans) in enumerate(options):
+            if option.conflicts & taken:
+                continue
+            nbusy = list(busy)
+            nlo = list(lo)
+            nhi = list(hi)
+            for section in sections:
+                for d in DAY_INDEXES[section.days]:
+                    nbusy[d] += section.end - section.start
+                    if section.start < nlo[d]:
+                        nlo[d] = section.start
+                    if section.end > nhi[d]:
+                        nhi[d] = section.end
+            ntaken = taken | option.bit
+            ndays = days | option_days
+            key = bound(level + 1, ntaken, ndays, nbusy, nlo, nhi)
+            children.append((key, index, option, ntaken, ndays, nbusy, nlo, nhi))
+        children.sort(key=lambda child: child[:2]) # Best first, ties in generation order
+        for key, index, option, ntaken, ndays, nbusy, nlo, nhi in children:
+            norder = order + index * i_step
+            if cut(key, norder):
+                if key > tuple(-k for k in best[0][0]):
+                    break # So are the rest
+                continue
+            chosen[i] = option
+            if level == depth - 1: # The bound is exact here
+                entry = (tuple(-k for k in key), -subset, -norder, flatten(chosen))
+                if len(best) < n:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heapreplace(best, entry)
+            else:
+                visit(level + 1, ntaken, ndays, nbusy, nlo, nhi, norder)
+
+    if not cut(bound(0, 0, 0, [0] * 5, [1440] * 5, [0] * 5), 0):
+        visit(0, 0, 0, [0] * 5, [1440] * 5, [0] * 5, 0)
@@ -0,0 +1,118 @@
+import json
+import BaseHTTPServer
+import SocketServer
+from urlparse import urlsplit,parse_qs
+
+from modules.api import best,Constraints
+from modules.memo import ScheduleMemo
+from modules.aurora import Aurora,AuroraError
+from modules.sorting import get_sort_key,get_rank_key,top
+from modules.render import comb_to_json
+
+DEFAULT_LIMIT = 20 # Schedules returned per query unless ?limit= is given
+
+"""
+    A local HTTP/JSON service answering schedule
+    queries from one warm Aurora, so course pages are
+    parsed once and then served from memory. Results
+    are remembered by a ScheduleMemo, so a follow-up
+    query that tightens a constraint or swaps an
+    elective reuses most of the previous work.
+
+    GET /schedules?term=fall15&must=COMP-1010&must=MATH-1500
+        &would=GEOL-1420,FREN-1152&number=3
+        &earliest=9:30 AM&latest=3:30 PM&xclude=COMP-1010-A01
+        &sort=compress|none|best&free=1&rank=free,gap&limit=20
+
+    Course lists can be repeated or comma separated. sort
+    defaults to compress, like the command line, and free=1
+    lists schedules with free days first. rank replaces
+    both with a ranking like the --rank argument. best
+    uses the branch and bound search, which doesn't
+    count every schedule.
+"""
+class ScheduleHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/schedules":
+            return self.send_json(404, {"error": "Not found: " + url.path})
+        try:
+            result = self.server.query(parse_qs(url.query))
+        except (ValueError, KeyError) as e:
+            return self.send_json(400, {"error": str(e)})
+        except AuroraError as e:
+            return self.send_json(502, {"error": str(e)})
+        self.send_json(200, result)
+
+    def send_json(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *fargs):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *fargs)
+
+
+class ScheduleServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, aurora=None, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, ScheduleHandler)
+        self.aurora = aurora or Aurora()
+        self.memo = ScheduleMemo(self.aurora)
+        self.verbose = verbose
+
+    def query(self, params):
+        def get_list(key):
+            return [i for value in params.get(key, []) for i in value.split(",") if i]
+        def get_one(key, default=None):
+            return params[key][-1] if key in params else default
+
+        term = get_one("term")
+        if not term:
+            raise ValueError("You must specify an academic term.")
+        must = get_list("must")
+        would = get_list("would")
+        if not must and not would:
+            raise ValueError("You must specify at least one course.")
+        number = int(get_one("number", len(must)))
+        limit = int(get_one("limit", DEFAULT_LIMIT))
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+        sort = get_one("sort", "compress")
+        free_days = get_one("free", "0") not in ("0", "")
+        constraints = Constraints(get_one("earliest"), get_one("latest"), get_list("xclude"))
+
+        if sort == "best":
+            combs = best(term, must, would, number, limit, free_days, constraints, self.aurora)
+            return {"schedules": [comb_to_json(comb) for comb in combs]}
+        if sort not in ("compress", "none"):
+            raise ValueError("Unknown sort: " + sort)
+
+        count = [0]
+        def counted(combs):
+            for comb in combs:
+                count[0] += 1
+                yield comb
+        if "rank" in params:
+            key = get_rank_key(get_one("rank"))
+        else:
+            key = get_sort_key(sort == "compress", free_days)
+        combs = top(counted(self.memo.generate(term, must, would, number, constraints)), limit, key)
+        return {"count": count[0], "schedules": [comb_to_json(comb) for comb in combs]}
+
+def serve(port, host="127.0.0.1", aurora=None, verbose=False):
+    server = ScheduleServer((host, port), aurora, verbose)
+    print("Serving schedules on http://" + host + ":" + str(port) + "/schedules")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
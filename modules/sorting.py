@@ -1,152 +1,181 @@
-from calendar import timegm
-"""
-    Convert a combination of
-    sections to a list containing
-    5 sorted lists of MTWRF
-"""
-def get_sorted_daylists(comb):
-    mon_sections = []
-    tues_sections = []
-    wed_sections = []
-    thurs_sections = []
-    fri_sections = []
-    for section in comb:
-        if "M" in section.day:
-            mon_sections.append(section)
-        if "T" in section.day:
-            tues_sections.append(section)
-        if "W" in section.day:
-            wed_sections.append(section)
-        if "R" in section.day:
-            thurs_sections.append(section)
-        if "F" in section.day:
-            fri_sections.append(section)
-    
-    # Sort
-    return [quicksort_sections(l) for l in [mon_sections,tues_sections,wed_sections,thurs_sections,fri_sections]]
-
-
-
-###############
-## QUICKSORT ##
-###############
-
+import heapq
+import itertools
+from collections import namedtuple,deque
+from modules.conflicts import comb_key
+from modules.classes import DAY_INDEXES
+##################
+## OPTIMIZATION ##
+##################
 """
-    Quicksorts a list of sections by
-    their start times.
+    What a schedule is ranked on:
+        gap       total minutes between classes over the week
+        gaps      number of gaps between classes
+        free      number of free weekdays
+        earliest  start of the earliest class, in minutes
+        latest    end of the latest class, in minutes
+        days      number of days with classes
 """
-def quicksort_sections(olist):
-    nlist = list(olist)
-    return quickSortHelper(nlist,0,len(nlist)-1)
-    
-    
-
-def quickSortHelper(nlist,first,last):
-    if first<last:
+Metrics = namedtuple("Metrics", "gap gaps free earliest latest days")
 
-        splitpoint = partition(nlist,first,last)
+"""
+    Compute every metric of a combination in one
+    pass over its sections. The sections of a valid
+    combination don't overlap, so the time between
+    classes on a day is the time from its first class
+    to its last one minus the time spent in class.
+"""
+def get_metrics(comb):
+    days = 0
+    busy = [0] * 5
+    lo = [1440] * 5
+    hi = [0] * 5
+    count = [0] * 5
+    for section in comb:
+        days |= section.days
+        start = section.start
+        end = section.end
+        for d in DAY_INDEXES[section.days]:
+            busy[d] += end - start
+            count[d] += 1
+            if start < lo[d]:
+                lo[d] = start
+            if end > hi[d]:
+                hi[d] = end
+    on = DAY_INDEXES[days]
+    if not on:
+        return Metrics(0, 0, 5, 0, 0, 0)
+    return Metrics(
+        sum(hi[d] - lo[d] - busy[d] for d in on),
+        sum(count[d] - 1 for d in on),
+        5 - len(on),
+        min(lo[d] for d in on),
+        max(hi[d] for d in on),
+        len(on))
 
-        quickSortHelper(nlist,first,splitpoint-1)
-        quickSortHelper(nlist,splitpoint+1,last)
-    
-    return nlist
+"""
+    Each metric oriented so that lower is better: less
+    time between classes, more free days, a later first
+    class, an earlier last class and fewer days on campus.
+"""
+METRIC_SIGNS = {"gap": 1, "gaps": 1, "free": -1, "earliest": -1, "latest": 1, "days": 1}
 
-    
-def partition(nlist,first,last):
-    pivot = nlist[first]
+"""
+    The sort key of a combination for compress:
+    (0, average time between classes, section ids)
+    for combinations with a gap to compress, and (1,)
+    for those with no more than 1 section on each
+    day, which sort last in their original order.
+"""
+def compress_key(comb):
+    return _compress_key(get_metrics(comb), comb)
 
-    leftmark = first+1
-    rightmark = last
+def _compress_key(metrics, comb):
+    if metrics.gaps == 0: # No more than 1 course on each day
+        return (1,)
+    return (0, metrics.gap / float(metrics.gaps), comb_key(comb))
 
-    done = False
-    while not done:
+"""
+    Sorts the section combinations by average distance
+    between sections in descending order. I.e., the
+    most "compressed" sections are at the top.
+"""
+def compress(combs):
+    return sorted(combs, key=compress_key)
 
-        while leftmark <= rightmark and  nlist[leftmark].start_time <= pivot.start_time:
-            leftmark = leftmark + 1
 
-        while nlist[rightmark].start_time >= pivot.start_time and rightmark >= leftmark:
-            rightmark = rightmark -1
+"""
+    The sort key of a combination for prefer_free:
+    the negated number of free days.
+"""
+def free_key(comb):
+    return -get_metrics(comb).free
 
-        if rightmark < leftmark:
-            done = True
-        else:
-            temp = nlist[leftmark]
-            nlist[leftmark] = nlist[rightmark]
-            nlist[rightmark] = temp
+"""
+    Sorts the section combinations by number of free
+    days in descending order. The sort is stable, so
+    an earlier compress order is kept among schedules
+    with the same number of free days.
+"""
+def prefer_free(combs):
+    return sorted(combs, key=free_key)
 
-    temp = nlist[first]
-    nlist[first] = nlist[rightmark]
-    nlist[rightmark] = temp
 
+"""
+    Get a sort key from a ranking such as
+    "free,gap" or "gap:1,free:60".
+
+    Plain metric names rank lexicographically: by
+    the first metric, then the second on ties, etc.
+    With name:weight pairs, combinations are ranked
+    by the weighted sum of the metrics instead, e.g.
+    an hour between classes costs as much as a free
+    day is worth with "gap:1,free:60". Metrics are
+    oriented so higher weights always mean that
+    metric matters more (see METRIC_SIGNS).
+    Remaining ties keep a fixed order by section ids.
+"""
+def get_rank_key(rank):
+    weighted, fields = parse_rank(rank)
+    if not weighted:
+        def lexicographic_key(comb):
+            metrics = get_metrics(comb)
+            return tuple(sign * metrics[i] for i, sign in fields) + (comb_key(comb),)
+        return lexicographic_key
+    def weighted_key(comb):
+        metrics = get_metrics(comb)
+        return (sum(weight * metrics[i] for i, weight in fields), comb_key(comb))
+    return weighted_key
 
-    return rightmark
+"""
+    Parses a ranking for get_rank_key. Returns
+    (weighted, [(index in Metrics, sign or signed
+    weight)] for each metric in the ranking).
+"""
+def parse_rank(rank):
+    names = []
+    weights = []
+    for part in rank.split(","):
+        name, _, weight = part.strip().partition(":")
+        if name not in METRIC_SIGNS:
+            raise ValueError("Unknown metric: " + name + " (choose from " + ", ".join(Metrics._fields) + ")")
+        names.append(name)
+        weights.append(float(weight) if weight else None)
+    if all(weight is None for weight in weights):
+        return False, [(Metrics._fields.index(name), METRIC_SIGNS[name]) for name in names]
+    if any(weight is None for weight in weights):
+        raise ValueError("Give every metric a weight, or none of them: " + rank)
+    return True, [(Metrics._fields.index(name), METRIC_SIGNS[name] * weight) for name, weight in zip(names, weights)]
 
 
-##################
-## OPTIMIZATION ##
-##################
 """
-    Sorts the section combinations by average distance
-    between sections in descending order. I.e., the
-    most "compressed" sections are at the top.
+    Get the key that sorts combinations the same way
+    as compress (if compression) followed by
+    prefer_free (if free_days), or None if neither.
 """
-def compress(combs):
-    comb_avgs = {}   # (Combination of sections) : (avg time between sections)
-    singledays = []  # List of days that can't be compressed (have < 2 courses)
-    for comb in combs:
-        daylist = get_sorted_daylists(comb)
-        tdiff = 0    # Total difference between course starts and ends
-        count = 0    # Total differences (total sections - 1)
-        
-        for day in daylist:
-            day = iter(day)
-            
-            try:
-                x1 = day.next()
-            except StopIteration: # Free day
-                continue
-            try:
-                while True:
-                    x2 = day.next()
-                    tdiff = (timegm(x2.start_time) - timegm(x1.end_time)) / 60
-                    count += 1
-                    x1 = x2
-            except StopIteration:
-                break
-        if count == 0: # No more than 1 course on each day
-            singledays.append(comb)
-            continue
-        comb_avgs[comb] = tdiff / count
-    
-    sorted_combs_tuples = sorted(comb_avgs.iteritems(), key=lambda (k,v): (v,k))
-    
-    # Convert to list of combs
-    sorted_combs = []
-    for comb_tuple in sorted_combs_tuples:
-        sorted_combs.append(comb_tuple[0])
-    
-    
-    return sorted_combs + singledays
-
+def get_sort_key(compression, free_days):
+    if compression and free_days:
+        def free_compress_key(comb):
+            metrics = get_metrics(comb)
+            return (-metrics.free, _compress_key(metrics, comb))
+        return free_compress_key
+    if compression:
+        return compress_key
+    if free_days:
+        return free_key
+    return None
 
 
-def prefer_free(combs):
-    comb_free = {}   # (Combination of sections) : number of days free
-    for comb in combs:
-        daylist = get_sorted_daylists(comb)
-        
-        count = 0   # Total number of free days
-        
-        for day in daylist:
-            if len(day) == 0:
-                count += 1
-        comb_free[comb] = count
-    
-    sorted_combs_tuples = sorted(comb_free.iteritems(), key=lambda (k,v): (v,k), reverse=True)
-    
-    # Convert to list of combs
-    sorted_combs = []
-    for comb_tuple in sorted_combs_tuples:
-        sorted_combs.append(comb_tuple[0])
-    
-    return sorted_combs
\ No newline at end of file
+"""
+    Get the n best combinations by key, in order,
+    keeping no more than n of them in memory.
+    With no key, the first n are kept, and the rest
+    are still read, so that a generator counting the
+    combinations sees all of them.
+"""
+def top(combs, n, key=None):
+    if key is None:
+        combs = iter(combs)
+        first = list(itertools.islice(combs, n))
+        deque(combs, 0)
+        return first
+    return heapq.nsmallest(n, combs, key=key)
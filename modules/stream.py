@@ -0,0 +1,60 @@
+import heapq
+import marshal
+import tempfile
+
+CHUNK_SIZE = 50000 # Max combinations held in memory by external_sort
+
+"""
+    Sorts combinations of indexed sections by key
+    without holding them all in memory. Combinations
+    are read in chunks of chunk_size, each chunk is
+    sorted and written to a temporary file as
+    (key, sequence number, section ids) records, and
+    the files are then merged lazily.
+
+    The sort is stable, like sorted(). Keys must be
+    made of ints, floats, strings and tuples.
+
+    Returns (number of combinations, iterator over
+    the sorted combinations).
+"""
+def external_sort(combs, key, chunk_size=CHUNK_SIZE):
+    sections = {}   # section id : section, for rebuilding combinations
+    runs = []       # Temporary files of sorted records
+    chunk = []
+    count = 0
+    for comb in combs:
+        for section in comb:
+            sections[section.id] = section
+        chunk.append((key(comb), count, tuple(section.id for section in comb)))
+        count += 1
+        if len(chunk) >= chunk_size:
+            runs.append(_write_run(chunk))
+            chunk = []
+
+    if runs and chunk:
+        runs.append(_write_run(chunk))
+        chunk = []
+
+    if not runs: # Everything fit in one chunk
+        chunk.sort()
+        records = iter(chunk)
+    else:
+        records = heapq.merge(*[_read_run(run) for run in runs])
+
+    return count, (tuple(sections[i] for i in ids) for _, _, ids in records)
+
+def _write_run(chunk):
+    chunk.sort()
+    run = tempfile.TemporaryFile()
+    for record in chunk:
+        marshal.dump(record, run)
+    run.seek(0)
+    return run
+
+def _read_run(run):
+    try:
+        while True:
+            yield marshal.load(run)
+    except EOFError:
+        run.close()
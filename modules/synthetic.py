@@ -0,0 +1,96 @@
+import random
+from collections import OrderedDict
+
+from modules.classes import Section,Course,format_minutes
+
+# Lecture patterns: (days, length in minutes, first start, time between starts)
+LECTURE_PATTERNS = [("MWF", 50, 8 * 60 + 30, 60), ("TR", 75, 8 * 60 + 30, 90)]
+# Lab patterns: (days, length in minutes, first start, time between starts)
+LAB_PATTERNS = [(day, 110, 8 * 60 + 30, 60) for day in "MTWRF"]
+# Extra weekly meetings of lectures (tutorials): (days, length in minutes, first start, time between starts)
+EXTRA_PATTERNS = [(day, 50, 8 * 60 + 30, 60) for day in "MTWRF"]
+DAY_START_SLOTS = 12 # Start times per pattern, 8:30 AM to 7:30 PM for MWF lectures
+
+"""
+    Synthetic catalogs for benchmarks: courses with a
+    chosen number of sections, share of courses with
+    labs, and time density, as Course/Section objects
+    or as Aurora course pages.
+
+    slots is the number of start times sections are
+    spread over. Fewer slots pack the sections into
+    less of the day, so more of them conflict. labs
+    is the number of lab sections of a course with a
+    lab, by default the same as sections. The same
+    seed always gives the same catalog.
+
+    With linked, each lab can only be taken with one
+    lecture (see Course.links), the labs being dealt
+    out to the lectures in turn. extra_ratio is the
+    share of lectures that also meet once a week at
+    another time, as a second Section of the same name
+    that doesn't overlap the first.
+"""
+def make_courses(count=6, sections=4, lab_ratio=0.5, slots=DAY_START_SLOTS, labs=None, seed=0, linked=False, extra_ratio=0.0):
+    rand = random.Random(seed)
+    slots = max(1, min(slots, DAY_START_SLOTS))
+    labs = sections if labs is None else labs
+    courses = []
+    for i in range(count):
+        course = Course("SYNT %04d" % (1000 + i))
+        for n in range(sections):
+            lecture = make_section(rand, "A%02d" % (n + 1), LECTURE_PATTERNS, slots, course)
+            course.sections.append(lecture)
+            if extra_ratio and rand.random() < extra_ratio:
+                extra = make_section(rand, lecture.name, EXTRA_PATTERNS, slots, course)
+                while extra.conflicts_with(lecture): # Lectures leave at least 2 days free
+                    extra = make_section(rand, lecture.name, EXTRA_PATTERNS, slots, course)
+                course.sections.append(extra)
+        if rand.random() < lab_ratio:
+            course.haslab = True
+            course.lab = Course(course.name)
+            for n in range(labs):
+                course.lab.sections.append(make_section(rand, "B%02d" % (n + 1), LAB_PATTERNS, slots, course))
+            if linked:
+                course.links = {}
+                for n in range(labs):
+                    course.links.setdefault("A%02d" % (n % max(1, sections) + 1), []).append("B%02d" % (n + 1))
+        courses.append(course)
+    return courses
+
+def make_section(rand, name, patterns, slots, course):
+    day, length, first, step = rand.choice(patterns)
+    start = first + step * rand.randrange(slots)
+    start = min(start, 21 * 60 - length) # End by 9:00 PM
+    return Section(name, start, start + length, day, course)
+
+
+"""
+    An Aurora course page listing the sections of a
+    course, in the markup modules.aurora.parse_course_page
+    reads.
+"""
+def make_course_page(course):
+    return make_listing_page([course])
+
+"""
+    A page listing the sections of many courses, like
+    a subject's class schedule on Aurora.
+"""
+def make_listing_page(courses):
+    rows = []
+    for course in courses:
+        meetings = OrderedDict() # section name : its meetings
+        for section in course.sections + (course.lab.sections if course.haslab else []):
+            meetings.setdefault(section.name, []).append(section)
+        for name, sections in meetings.items():
+            rows.append('<tr><th class="ddtitle"><a href="#">Synthetic Course - %d - %s - %s</a></th></tr>'
+                    % (10000 + len(rows) // 2, course.name, name))
+            rows.append('<tr><td class="dddefault">'
+                    '<table summary="This table lists the scheduled meeting times and assigned instructors for this class..">'
+                    '<tr><th>Type</th><th>Time</th><th>Days</th></tr>'
+                    + "".join('<tr><td>Class</td><td>%s - %s</td><td>%s</td></tr>'
+                        % (format_minutes(section.start), format_minutes(section.end), section.day) for section in sections)
+                    + '</table></td></tr>')
+    return ('<html><body><table summary="This layout table is used to present the sections found">'
+            + "".join(rows) + '</table></body></html>')
@@ -0,0 +1,206 @@
+try:
+    import numpy
+except ImportError: # NumPy is optional, see available()
+    numpy = None
+
+from modules.classes import Unit,flatten
+from modules.conflicts import comb_key
+from modules.sorting import Metrics,parse_rank
+
+BLOCK_SIZE = 1 << 14 # Partial schedules checked at once
+
+"""
+    An optional NumPy backend for runs that search and
+    rank every schedule. Instead of building each
+    schedule and computing its metrics in Python, the
+    schedules of a subset are built as blocks of index
+    arrays (one column per section list), the conflict
+    checks and metrics are applied to whole blocks, and
+    only the valid schedules are turned into tuples of
+    sections. The results are the same as the pure
+    Python search and sort keys give, in the same order.
+"""
+def available():
+    return numpy is not None
+
+
+"""
+    The section lists of one subset as arrays: for
+    each list, a table of what each option adds to
+    each day (class minutes, first start, last end,
+    number of meetings), and for each pair of lists,
+    which options conflict.
+"""
+class Tables:
+
+    def __init__(self, s_lists):
+        self.options = [list(options) for options in s_lists]
+        self.units = any(option.__class__ is Unit for options in self.options for option in options)
+        self.columns = [] # Each list's options as an object array
+        self.busy = []
+        self.lo = []
+        self.hi = []
+        self.count = []
+        for options in self.options:
+            column = numpy.empty(len(options), dtype=object)
+            column[:] = options
+            self.columns.append(column)
+            busy = numpy.zeros((len(options), 5), dtype=numpy.int64)
+            lo = numpy.full((len(options), 5), 1440, dtype=numpy.int64)
+            hi = numpy.zeros((len(options), 5), dtype=numpy.int64)
+            count = numpy.zeros((len(options), 5), dtype=numpy.int64)
+            for i, option in enumerate(options):
+                for section in flatten((option,)):
+                    for d in range(5):
+                        if section.days & (1 << d):
+                            busy[i, d] += section.end - section.start
+                            lo[i, d] = min(lo[i, d], section.start)
+                            hi[i, d] = max(hi[i, d], section.end)
+                            count[i, d] += 1
+            self.busy.append(busy)
+            self.lo.append(lo)
+            self.hi.append(hi)
+            self.count.append(count)
+
+        # conflicts[j][i]: (options of list i) x (options of list j), for i < j
+        self.conflicts = []
+        for j, later in enumerate(self.options):
+            self.conflicts.append([numpy.array([[bool(a.conflicts & b.bit) for b in later] for a in earlier], dtype=bool).reshape(len(earlier), len(later))
+                    for earlier in self.options[:j]])
+
+    """
+        Yields blocks of valid schedules as arrays of
+        option indexes, one row per schedule, in the
+        order iter_valid_combinations yields them.
+    """
+    def search(self, block=BLOCK_SIZE):
+        depth = len(self.options)
+        if depth == 0 or not all(self.options):
+            return
+        for found in self._expand(0, numpy.zeros((1, 0), dtype=numpy.intp), block):
+            yield found
+
+    # Extends each partial schedule (a row of prefix) with every option of
+    # list level that doesn't conflict with it. Rows are extended in order,
+    # and each with the options in order, so the product order is kept.
+    def _expand(self, level, prefix, block):
+        if level == len(self.options):
+            yield prefix
+            return
+        n = len(self.options[level])
+        step = max(1, block // n)
+        choices = numpy.arange(n, dtype=numpy.intp)
+        for start in range(0, len(prefix), step):
+            rows = numpy.repeat(prefix[start:start + step], n, axis=0)
+            chosen = numpy.tile(choices, len(rows) // n)
+            valid = numpy.ones(len(rows), dtype=bool)
+            for earlier in range(level):
+                valid &= ~self.conflicts[level][earlier][rows[:, earlier], chosen]
+            if valid.any():
+                extended = numpy.column_stack((rows[valid], chosen[valid]))
+                for found in self._expand(level + 1, extended, block):
+                    yield found
+
+    """
+        The Metrics of each schedule in a block, as a
+        Metrics of arrays, like sorting.get_metrics.
+    """
+    def metrics(self, found):
+        busy = sum(self.busy[level][found[:, level]] for level in range(found.shape[1]))
+        count = sum(self.count[level][found[:, level]] for level in range(found.shape[1]))
+        lo = numpy.minimum.reduce([self.lo[level][found[:, level]] for level in range(found.shape[1])])
+        hi = numpy.maximum.reduce([self.hi[level][found[:, level]] for level in range(found.shape[1])])
+        on = count > 0
+        days = on.sum(axis=1)
+        return Metrics(
+            numpy.where(on, hi - lo - busy, 0).sum(axis=1),
+            numpy.where(on, count - 1, 0).sum(axis=1),
+            5 - days,
+            numpy.where(days > 0, numpy.where(on, lo, 1440).min(axis=1), 0),
+            numpy.where(on, hi, 0).max(axis=1),
+            days)
+
+    """
+        The schedules in a block as tuples of sections.
+    """
+    def combinations(self, found):
+        combs = zip(*[column[found[:, level]] for level, column in enumerate(self.columns)])
+        if self.units:
+            return [flatten(comb) for comb in combs]
+        return combs
+
+
+"""
+    Searches every subset's section lists and returns
+    the valid schedules with their metrics, as (list of
+    schedules, Metrics of arrays).
+"""
+def search_with_metrics(s_lists_seq, block=BLOCK_SIZE):
+    combs = []
+    parts = []
+    for s_lists in s_lists_seq:
+        tables = Tables(s_lists)
+        for found in tables.search(block):
+            combs.extend(tables.combinations(found))
+            parts.append(tables.metrics(found))
+    if not parts:
+        return combs, Metrics(*[numpy.zeros(0, dtype=numpy.int64)] * len(Metrics._fields))
+    return combs, Metrics(*[numpy.concatenate([part[i] for part in parts]) for i in range(len(Metrics._fields))])
+
+
+"""
+    Searches every subset's section lists and sorts the
+    schedules like sorting.get_sort_key(compression,
+    free_days), or sorting.get_rank_key(rank) if rank
+    is given. Returns the sorted list of schedules.
+"""
+def rank_combinations(s_lists_seq, compression=True, free_days=False, rank=None, block=BLOCK_SIZE):
+    combs, metrics = search_with_metrics(s_lists_seq, block)
+    columns, tiebreak = get_key_columns(metrics, compression, free_days, rank)
+    if not columns or not combs:
+        return combs
+    order = numpy.lexsort(columns[::-1]) # lexsort is stable and sorts by its last key first
+    combs = [combs[i] for i in order]
+    if tiebreak is not None:
+        _break_ties(combs, numpy.column_stack(columns)[order], tiebreak[order])
+    return combs
+
+"""
+    The columns the schedules are sorted by, most
+    significant first, and which schedules have their
+    ties broken by comb_key (or None if none do), the
+    same way as the pure Python sort keys.
+"""
+def get_key_columns(metrics, compression, free_days, rank):
+    if rank:
+        weighted, fields = parse_rank(rank)
+        if weighted:
+            total = None
+            for i, weight in fields:
+                total = weight * metrics[i] if total is None else total + weight * metrics[i]
+            columns = [total]
+        else:
+            columns = [sign * metrics[i] for i, sign in fields]
+        return columns, numpy.ones(len(metrics.gap), dtype=bool)
+    columns = []
+    tiebreak = None
+    if free_days:
+        columns.append(-metrics.free)
+    if compression:
+        # (1,) for schedules with no gaps, else (0, average gap, section ids)
+        spread = metrics.gaps == 0
+        average = numpy.where(spread, 0.0, metrics.gap / numpy.maximum(metrics.gaps, 1).astype(float))
+        columns.extend([spread.astype(numpy.int64), average])
+        tiebreak = ~spread
+    return columns, tiebreak
+
+# Sorts each run of schedules with equal key columns by comb_key
+def _break_ties(combs, keys, tiebreak):
+    if len(combs) < 2:
+        return
+    tied = (keys[1:] == keys[:-1]).all(axis=1) & tiebreak[1:]
+    starts = numpy.flatnonzero(~tied) + 1 # Where each run of ties starts, after the first
+    bounds = [0] + starts.tolist() + [len(combs)]
+    for start, end in zip(bounds, bounds[1:]):
+        if end - start > 1:
+            combs[start:end] = sorted(combs[start:end], key=comb_key)